@@ -0,0 +1,119 @@
+"""
+Compare the memory taken by a large inventory of module instances kept as
+a plain list of dicts (i.e. as returned by the API) vs `relay.inventory`.
+
+Usage (from the root of the repository, unless the package is installed):
+PYTHONPATH=. python benchmarks/inventory_memory.py [--count 100000]
+
+Both the retained and the peak memory are reported, since the whole response
+has to be parsed before the inventory can be built out of it. The build time
+is measured separately without `tracemalloc`, which slows everything down.
+"""
+import argparse
+import gc
+import json
+import timeit
+import tracemalloc
+import uuid
+
+from relay.constants import RELAY_MODULE_SUPPORTED_APIS
+from relay.inventory import Inventory
+
+
+MODULE_TYPE_IDS = [str(uuid.uuid4()) for _ in range(20)]
+
+
+def response_text(count):
+    """
+    Imitate the JSON response of `GET /iroh/iroh-int/module-instance`.
+    """
+    modules = [
+        {
+            'id': str(uuid.uuid4()),
+            'name': 'Relay Module #{}'.format(index),
+            'module_type_id': MODULE_TYPE_IDS[index % len(MODULE_TYPE_IDS)],
+            'visibility': 'org',
+            'enabled': True,
+            'client_id': 'client-{}'.format(uuid.uuid4()),
+            'org_id': str(uuid.uuid4()),
+            'created_at': '2020-01-01T00:00:00.000Z',
+            'settings': {
+                'url': 'https://relay-{}.example.com/api'.format(index),
+                'auth-type': 'authorization-header',
+                'authorization-header': 'Bearer {}'.format(uuid.uuid4()),
+                'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+            },
+        }
+        for index in range(count)
+    ]
+    return json.dumps(modules)
+
+
+def measure(build):
+    gc.collect()
+    start = timeit.default_timer()
+    build()
+    duration = timeit.default_timer() - start
+
+    gc.collect()
+    tracemalloc.start()
+
+    result = build()
+
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, current, peak, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    text = response_text(args.count)
+
+    modules, dicts_current, dicts_peak, dicts_duration = measure(
+        lambda: json.loads(text)
+    )
+
+    def build_inventory():
+        # The list of dicts is parsed and then consumed, just as in the client
+        # with `release_modules` set.
+        return Inventory.consume(json.loads(text))
+
+    del modules
+    inventory, records_current, records_peak, records_duration = measure(
+        build_inventory
+    )
+
+    lookups = [
+        (record.name, record.module_type_id) for record in inventory
+    ][:1000]
+    lookups_duration = timeit.timeit(
+        lambda: [inventory.find(*key) for key in lookups], number=10
+    ) / (10 * len(lookups))
+
+    mb = 1024.0 * 1024.0
+    print('Modules: {}'.format(args.count))
+    print('{:<16}{:>14}{:>14}{:>12}'.format(
+        '', 'Retained, MB', 'Peak, MB', 'Build, s'
+    ))
+    print('{:<16}{:>14.1f}{:>14.1f}{:>12.2f}'.format(
+        'list of dicts', dicts_current / mb, dicts_peak / mb, dicts_duration
+    ))
+    print('{:<16}{:>14.1f}{:>14.1f}{:>12.2f}'.format(
+        'inventory', records_current / mb, records_peak / mb, records_duration
+    ))
+    print('Retained memory ratio: {:.2f}'.format(
+        records_current / float(dicts_current)
+    ))
+    print('Peak memory ratio: {:.2f}'.format(
+        records_peak / float(dicts_peak)
+    ))
+    print('Lookup by name and type: {:.2f} us'.format(lookups_duration * 1e6))
+
+
+if __name__ == '__main__':
+    main()
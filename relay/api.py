@@ -0,0 +1,429 @@
+import collections
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from threatresponse import ThreatResponse
+
+from relay.concurrency import AdaptiveLimiter, overloaded, throttled
+from relay.drift import canonical_hash
+from relay.exceptions import (
+    ModuleAlreadyExistsError,
+    ModuleDoesNotExistError,
+    ModuleHasNotBeenChangedError,
+)
+from relay.inventory import Inventory, ModuleRecord
+from relay.metrics import (
+    API_REQUEST_DURATION,
+    API_REQUEST_ERRORS,
+    API_REQUEST_RETRIES,
+    AUTH_DURATION,
+    MODULES_APPLIED,
+)
+
+
+_Result = collections.namedtuple('Result', ('action', 'name', 'module_id'))
+
+
+class Result(_Result):
+    """
+    The outcome of a single operation over a Relay module.
+    The `action` is one of "added", "edited", "removed" or "unchanged".
+    """
+
+    __slots__ = ()
+
+    templates = {
+        'added': 'Relay module "{name}" has been successfully added!',
+        'edited': 'Relay module "{name}" has been successfully edited!',
+        'removed': 'Relay module "{name}" has been successfully removed!',
+        'unchanged': 'Relay module "{name}" is already up to date!',
+    }
+
+    @property
+    def message(self):
+        return self.templates[self.action].format(name=self.name)
+
+    def __str__(self):
+        return self.message
+
+
+ACTIONS = ('add', 'edit', 'remove', 'sync')
+
+Operation = collections.namedtuple('Operation', ('action', 'settings'))
+
+Outcome = collections.namedtuple('Outcome', ('operation', 'result', 'error'))
+
+
+class RelayClient(object):
+    """
+    Manage Relay modules in Threat Response from within a Python process.
+    The client holds an authorized Threat Response session along with the
+    inventory of module instances, so the latter is fetched only once and
+    then kept up to date locally while performing multiple operations.
+    The API calls are limited by an adaptive concurrency `limiter` (check
+    `relay.concurrency.AdaptiveLimiter`), and the throttled ones are retried
+    up to `retries` times with an exponential backoff.
+    If `release_modules` is set, then the list of modules fetched from the
+    API is emptied while building the inventory (check `Inventory.consume`),
+    which lowers the peak memory usage for very large numbers of modules.
+    """
+
+    retries = 3
+    retry_backoff = 0.1  # seconds
+    release_modules = False
+
+    def __init__(self, tr, limiter=None):
+        self._tr = tr
+        self._modules = None
+        self._lock = threading.RLock()
+
+        self.limiter = limiter or AdaptiveLimiter()
+
+    @classmethod
+    def connect(cls, client_id, client_password, limiter=None, **options):
+        """
+        Authorize a new Threat Response session and wrap it into a client.
+        Any extra options are passed to `ThreatResponse` as is.
+        """
+        with AUTH_DURATION.time():
+            tr = ThreatResponse(client_id, client_password, **options)
+        return cls(tr, limiter)
+
+    @property
+    def modules(self):
+        with self._lock:
+            if self._modules is None:
+                modules = self._call('module_instance', 'get')
+                if self.release_modules:
+                    self._modules = Inventory.consume(modules)
+                else:
+                    self._modules = Inventory(modules)
+            return self._modules
+
+    def refresh(self):
+        """
+        Discard the cached inventory, so it is re-fetched on the next access.
+        """
+        with self._lock:
+            self._modules = None
+
+    def find(self, settings):
+        with self._lock:
+            return self.modules.find(
+                settings['name'], settings['module_type_id']
+            )
+
+    def module_types(self):
+        """
+        Fetch the catalog of module types available to the client.
+        """
+        return self._call('module_type', 'get')
+
+    def execute(self, operations):
+        """
+        Perform lots of operations (i.e. instances of `Operation` with one of
+        "add", "edit", "remove" or "sync" as the action) at once.
+        The operations targeting the same module (i.e. having the same name
+        and type) are performed in order, the consecutive ones being merged
+        into a single API call where possible (check `_perform_all`), while
+        the ones targeting different modules are performed concurrently as
+        far as the `limiter` allows.
+        Return an `Outcome` for each of the given operations, in order, just
+        as if the operations were performed one by one. A failure of an
+        operation does not prevent the others from being performed.
+        """
+        operations = list(operations)
+        groups = list(group(enumerate(operations), _operation).values())
+        if not groups:
+            return []
+
+        # Make sure the inventory is fetched only once beforehand.
+        self.modules
+
+        pool = ThreadPool(min(self.limiter.maximum, len(groups)))
+        try:
+            performed = pool.map(
+                self._perform_all,
+                [[operation for _, operation in items] for items in groups],
+            )
+        finally:
+            pool.close()
+            pool.join()
+
+        outcomes = [None] * len(operations)
+        for items, group_outcomes in zip(groups, performed):
+            for (index, _), outcome in zip(items, group_outcomes):
+                outcomes[index] = outcome
+        return outcomes
+
+    def add(self, settings):
+        record = self.find(settings)
+        if record:
+            raise _already_exists(settings)
+
+        return _applied(self._add(settings))
+
+    def edit(self, settings):
+        record = self.find(settings)
+        if not record:
+            raise _does_not_exist(settings)
+
+        diff = _diff(record, settings)
+        if not diff:
+            raise _not_changed(settings)
+
+        return _applied(self._edit(record, diff))
+
+    def remove(self, settings):
+        record = self.find(settings)
+        if not record:
+            raise _does_not_exist(settings)
+
+        return _applied(self._remove(record))
+
+    def sync(self, settings):
+        """
+        Make a module match the settings: add it if it does not exist yet,
+        edit it if it differs, or leave it intact otherwise.
+        """
+        record = self.find(settings)
+        if not record:
+            return _applied(self._add(settings))
+
+        diff = _diff(record, settings)
+        if not diff:
+            return _applied(Result('unchanged', record.name, record.id))
+
+        return _applied(self._edit(record, diff))
+
+    def _add(self, settings):
+        module = self._call('module_instance', 'post', settings)
+
+        if isinstance(module, dict) and 'id' in module:
+            with self._lock:
+                self.modules.add(module)
+            module_id = module['id']
+        else:
+            # Unable to tell what has actually been created,
+            # so just re-fetch the inventory next time.
+            self.refresh()
+            module_id = None
+
+        return Result('added', settings['name'], module_id)
+
+    def _edit(self, record, diff):
+        self._call('module_instance', 'patch', record.id, diff)
+
+        with self._lock:
+            self.modules.update(record, diff)
+
+        return Result('edited', record.name, record.id)
+
+    def _remove(self, record):
+        self._call('module_instance', 'delete', record.id)
+
+        with self._lock:
+            self.modules.remove(record)
+
+        return Result('removed', record.name, record.id)
+
+    def _perform_all(self, operations):
+        """
+        Perform the operations over the same module in order, merging the
+        consecutive ones into a single API call where possible: an addition
+        followed by edits becomes a single addition, and several edits become
+        a single patch. Still, each operation is checked against the state of
+        the module all the previous ones would have left, so the outcomes are
+        the same as if the operations were performed one by one.
+        Return an `Outcome` for each of the operations, in order.
+        """
+        # Keyed by the indices, since the operations themselves may be equal.
+        outcomes = {}
+        # The module is either missing (`None`), intact (the record itself)
+        # or changed by the pending operations (the changed module).
+        record = state = self.find(operations[0].settings)
+        pending = []
+
+        for index, operation in enumerate(operations):
+            settings = operation.settings
+            try:
+                if operation.action == 'remove':
+                    record, state = self._flush(operations, pending,
+                                                record, state, outcomes)
+                    if record is None:
+                        raise _does_not_exist(settings)
+
+                    result = _applied(self._remove(record))
+                    outcomes[index] = Outcome(operation, result, None)
+                    record = state = None
+
+                elif state is None:
+                    if operation.action == 'edit':
+                        raise _does_not_exist(settings)
+
+                    state = dict(settings)
+                    pending.append((index, 'added'))
+
+                elif operation.action == 'add':
+                    raise _already_exists(settings)
+
+                else:
+                    diff = _changes(state, settings)
+                    if diff:
+                        state = _changed(state, diff)
+                        pending.append((index, 'edited'))
+                    elif operation.action == 'sync':
+                        pending.append((index, 'unchanged'))
+                    else:
+                        raise _not_changed(settings)
+
+            except Exception as error:
+                outcomes[index] = Outcome(operation, None, error)
+
+        self._flush(operations, pending, record, state, outcomes)
+
+        return [outcomes[index] for index in range(len(operations))]
+
+    def _perform(self, operation):
+        try:
+            result = getattr(self, operation.action)(operation.settings)
+            return Outcome(operation, result, None)
+        except Exception as error:
+            return Outcome(operation, None, error)
+
+    def _flush(self, operations, pending, record, state, outcomes):
+        # Make the single API call for all the pending operations (if any
+        # is needed at all) and settle their outcomes.
+        # Return the actual record of the module and its state afterwards.
+        if not pending:
+            return record, state
+
+        settings = operations[pending[0][0]].settings
+        try:
+            if pending[0][1] == 'added':
+                module_id = self._add(state).module_id
+            else:
+                module_id = record.id
+                if state is not record:
+                    diff = _changes(record, state)
+                    if diff:
+                        self._edit(record, diff)
+        except Exception as error:
+            if len(pending) == 1:
+                index, _ = pending[0]
+                outcomes[index] = Outcome(operations[index], None, error)
+            else:
+                # Unable to tell which of the merged operations is to blame,
+                # so fall back to performing them one by one after all.
+                for index, _ in pending:
+                    outcomes[index] = self._perform(operations[index])
+        else:
+            for index, action in pending:
+                result = _applied(Result(action, settings['name'], module_id))
+                outcomes[index] = Outcome(operations[index], result, None)
+
+        del pending[:]
+
+        record = self.find(settings)
+        return record, record
+
+    def _call(self, api, method, *args):
+        labels = {'api': api, 'method': method}
+        attempt = 0
+        while True:
+            token = self.limiter.acquire((api, method))
+            dropped = False
+            try:
+                with API_REQUEST_DURATION.time(**labels):
+                    return getattr(getattr(self._tr.int, api), method)(*args)
+            except Exception as error:
+                API_REQUEST_ERRORS.inc(**labels)
+                dropped = overloaded(error)
+                if not throttled(error) or attempt >= self.retries:
+                    raise
+            finally:
+                self.limiter.release(token, dropped)
+
+            API_REQUEST_RETRIES.inc(**labels)
+            time.sleep(self.retry_backoff * 2 ** attempt)
+            attempt += 1
+
+
+def _applied(result):
+    MODULES_APPLIED.inc(action=result.action)
+    return result
+
+
+def group(items, operation=lambda item: item):
+    """
+    Group operations (or any items holding them, check `operation`) by the
+    module they target (i.e. by name and type).
+    Return an ordered mapping from the module keys to the lists of the
+    items, which are still to be performed in order.
+    """
+    groups = collections.OrderedDict()
+
+    for item in items:
+        action, settings = operation(item)
+        if action not in ACTIONS:
+            raise ValueError('Unknown action: "{}".'.format(action))
+
+        groups.setdefault(
+            (settings['name'], settings['module_type_id']), []
+        ).append(item)
+
+    return groups
+
+
+def _operation(item):
+    # The operation of an (index, operation) pair.
+    return item[1]
+
+
+def _already_exists(settings):
+    template = 'Relay module "{name}" already exists!'
+    return ModuleAlreadyExistsError(template.format(**settings))
+
+
+def _does_not_exist(settings):
+    template = 'Relay module "{name}" does not exist!'
+    return ModuleDoesNotExistError(template.format(**settings))
+
+
+def _not_changed(settings):
+    template = 'Relay module "{name}" has not been changed!'
+    return ModuleHasNotBeenChangedError(template.format(**settings))
+
+
+def _diff(record, settings):
+    # Most modules are expected to be intact, so avoid parsing them if the
+    # canonical hashes already match.
+    if record.digest == canonical_hash(settings):
+        return {}
+
+    module = record.module()
+    return {
+        key: value
+        for key, value in settings.items()
+        if module[key] != value
+    }
+
+
+def _changes(state, settings):
+    # The state of a module is either a record or an already parsed module.
+    if isinstance(state, ModuleRecord):
+        return _diff(state, settings)
+
+    return {
+        key: value
+        for key, value in settings.items()
+        if state.get(key) != value
+    }
+
+
+def _changed(state, diff):
+    module = state.module() if isinstance(state, ModuleRecord) else state
+    module = dict(module)
+    module.update(diff)
+    return module
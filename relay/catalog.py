@@ -0,0 +1,131 @@
+import io
+import json
+import logging
+import os
+import time
+
+import six
+
+from relay.constants import (
+    CATALOG_FILE_DEFAULT,
+    CATALOG_TTL_DEFAULT,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog(object):
+    """
+    A local cache of the Threat Response module type catalog, which allows to
+    validate the types (and the expected settings) of Relay modules offline.
+    The catalog is a mapping from the IDs of the module types to their specs:
+    {
+        "<module_type_id>": {
+            "title": "...",
+            "settings": {"<key>": <required>, ...}
+        },
+        ...
+    }
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = os.path.expanduser(path or CATALOG_FILE_DEFAULT)
+        self.ttl = CATALOG_TTL_DEFAULT if ttl is None else ttl
+
+    def get(self, client=None):
+        """
+        Return the cached catalog. If it has expired (or it is missing) and
+        a client is given, then refresh the catalog first. Without a client
+        (or if the refreshing fails) the cached catalog is returned regardless
+        of its age, since the catalog is just a way to fail fast.
+        Return `None` if there is no catalog available.
+        """
+        data = self._read()
+
+        if client is not None and not self._fresh(data):
+            try:
+                module_types = self.refresh(client)
+            except Exception as error:
+                logger.warning(
+                    'Unable to refresh the module type catalog: %s', error
+                )
+            else:
+                if module_types:
+                    return module_types
+                logger.warning(
+                    'Unable to refresh the module type catalog: '
+                    'unexpected or empty response.'
+                )
+
+        return data and data['module_types'] or None
+
+    def fresh(self):
+        """
+        Return the cached catalog only if it has not expired yet.
+        Return `None` otherwise.
+        """
+        data = self._read()
+        return self._fresh(data) and data['module_types'] or None
+
+    def refresh(self, client):
+        """
+        Fetch the catalog with a client (check `relay.api.RelayClient`) and
+        save it to the cache. Return the catalog just fetched.
+        Return `None` (and keep the cache intact) if the response is not
+        a non-empty list of module types.
+        """
+        module_types = _parse(client.module_types())
+        if not module_types:
+            return None
+
+        data = {'fetched_at': time.time(), 'module_types': module_types}
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with io.open(self.path, 'w', encoding='utf-8') as catalog_file:
+            catalog_file.write(
+                six.text_type(json.dumps(data, indent=2, sort_keys=True))
+            )
+
+        return module_types
+
+    def _fresh(self, data):
+        return (
+            data is not None and time.time() - data['fetched_at'] <= self.ttl
+        )
+
+    def _read(self):
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as catalog_file:
+                data = json.load(catalog_file)
+            data['fetched_at'], data['module_types']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            # A broken cache is no worse than a missing one.
+            return None
+        return data
+
+
+def _parse(module_types):
+    # Do not trust the API response too much, the catalog is just a shortcut
+    # for failing fast, while the API itself has the final say anyway.
+    if not isinstance(module_types, list):
+        return None
+
+    catalog = {}
+    for module_type in module_types:
+        if not isinstance(module_type, dict) or 'id' not in module_type:
+            continue
+
+        fields = module_type.get('configuration_spec') or []
+        catalog[module_type['id']] = {
+            'title': module_type.get('title') or module_type['id'],
+            'settings': {
+                field['key']: bool(field.get('required'))
+                for field in fields
+                if isinstance(field, dict) and 'key' in field
+            },
+        }
+    return catalog
@@ -1,45 +1,137 @@
-import click
-from threatresponse import ThreatResponse
+import functools
+import io
+import json
+import logging
+import multiprocessing
 
+import click
+from relay.api import RelayClient
+from relay.catalog import Catalog
 from relay.constants import (
+    CATALOG_FILE_DEFAULT,
+    CATALOG_TTL_DEFAULT,
     CLIENT_ID_ENVVAR,
     CLIENT_PASSWORD_ENVVAR,
+    DRIFT_EXIT_CODE,
     SETTINGS_FILE_DEFAULT,
+    VALIDATE_CACHE_FILE_DEFAULT,
 )
-from relay.exceptions import (
-    ModuleAlreadyExistsError,
-    ModuleDoesNotExistError,
-    ModuleHasNotBeenChangedError,
-)
-from relay.settings import load_settings
+from relay.drift import detect_drift
+from relay.exceptions import SettingsValidationError
+from relay.metrics import REGISTRY
+from relay.profiling import Profiler
+from relay.settings import check_module_type, load_settings
+from relay.validate import ValidationCache, settings_files, validate_files
 
 
 @click.group()
-def relay():
-    pass
-
-
-def relay_command(function):
-    @click.command(function.__name__)
-    @click.option(
-        '-i', '--client_id',
-        prompt='Client ID',
-        envvar=CLIENT_ID_ENVVAR,
-        help='The ID of a Threat Response API client.',
-    )
-    @click.option(
-        '-p', '--client_password',
-        prompt='Client Password',
-        envvar=CLIENT_PASSWORD_ENVVAR,
-        hide_input=True,
-        help='The password of a Threat Response API client.',
-    )
-    @click.option(
-        '-f', '--settings_file',
-        type=click.File('r'),
-        default=SETTINGS_FILE_DEFAULT,
-        help='The path to a Relay settings file.',
-    )
+@click.option(
+    '--metrics_file',
+    type=click.Path(dir_okay=False),
+    help='The path to write Prometheus metrics to on exit.',
+)
+@click.option(
+    '--metrics_port',
+    type=click.IntRange(min=0, max=65535),
+    help='The local port to expose Prometheus metrics on while running.',
+)
+@click.option(
+    '--profile',
+    type=click.Path(dir_okay=False),
+    help='The path prefix to write the profile of the command to.',
+)
+@click.option(
+    '--profile_top',
+    type=click.IntRange(min=0),
+    default=20,
+    show_default=True,
+    help='The number of the top functions to print the profile summary for.',
+)
+@click.option(
+    '--catalog_file',
+    type=click.Path(dir_okay=False),
+    help='The path to a cache of the module type catalog.  '
+         '[default: {}]'.format(CATALOG_FILE_DEFAULT),
+)
+@click.option(
+    '--catalog_ttl',
+    type=click.IntRange(min=0),
+    default=CATALOG_TTL_DEFAULT,
+    show_default=True,
+    help='The number of seconds to cache the module type catalog for.',
+)
+@click.pass_context
+def relay(context, metrics_file, metrics_port, profile, profile_top,
+          catalog_file, catalog_ttl):
+    context.obj = Catalog(catalog_file, catalog_ttl)
+
+    logger = logging.getLogger('relay')
+    handler = _WarningHandler()
+    logger.addHandler(handler)
+    context.call_on_close(lambda: logger.removeHandler(handler))
+
+    if metrics_port is not None:
+        server = REGISTRY.serve(metrics_port)
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+
+        context.call_on_close(stop)
+
+        template = 'Serving metrics on http://{}:{}/metrics'
+        click.echo(template.format(*server.server_address[:2]), err=True)
+
+    if metrics_file:
+        context.call_on_close(lambda: REGISTRY.write(metrics_file))
+
+    if profile:
+        profiler = Profiler()
+
+        def finish():
+            profiler.stop()
+            paths = profiler.write(profile)
+            stderr = click.get_text_stream('stderr')
+            if profile_top:
+                profiler.summary(stderr, profile_top)
+            click.echo('Profile written to: {}'.format(', '.join(paths)),
+                       err=True)
+
+        context.call_on_close(finish)
+        profiler.start()
+
+
+client_id_option = click.option(
+    '-i', '--client_id',
+    prompt='Client ID',
+    envvar=CLIENT_ID_ENVVAR,
+    help='The ID of a Threat Response API client.',
+)
+
+client_password_option = click.option(
+    '-p', '--client_password',
+    prompt='Client Password',
+    envvar=CLIENT_PASSWORD_ENVVAR,
+    hide_input=True,
+    help='The password of a Threat Response API client.',
+)
+
+settings_file_option = click.option(
+    '-f', '--settings_file',
+    type=click.File('r'),
+    default=SETTINGS_FILE_DEFAULT,
+    help='The path to a Relay settings file.',
+)
+
+
+def relay_command(function=None, settings_file=True):
+    if function is None:
+        return functools.partial(relay_command, settings_file=settings_file)
+
+    options = [client_id_option, client_password_option]
+    if settings_file:
+        options.append(settings_file_option)
+
     def command(*args, **kwargs):
         try:
             result = function(*args, **kwargs)
@@ -50,90 +142,222 @@ def relay_command(function):
             message = click.style(str(exception), fg='red')
             raise click.ClickException(message)
 
-    relay.add_command(command)
+    for option in reversed(options):
+        command = option(command)
+
+    relay.add_command(click.command(function.__name__)(command))
 
 
 @relay_command
 def add(client_id, client_password, settings_file):
-    tr = ThreatResponse(client_id, client_password)
-
-    settings = load_settings(settings_file)
+    module_types = _catalog().fresh()
 
-    modules = tr.int.module_instance.get()
+    settings = load_settings(settings_file, module_types)
 
-    module = _module(modules, settings)
-    if module:
-        template = 'Relay module "{name}" already exists!'
-        message = template.format(**settings)
-        raise ModuleAlreadyExistsError(message)
+    client = _client(client_id, client_password, [settings], module_types)
 
-    tr.int.module_instance.post(settings)
-
-    template = 'Relay module "{name}" has been successfully added!'
-    return template.format(**settings)
+    return client.add(settings)
 
 
 @relay_command
 def edit(client_id, client_password, settings_file):
-    tr = ThreatResponse(client_id, client_password)
+    module_types = _catalog().fresh()
 
-    settings = load_settings(settings_file)
+    settings = load_settings(settings_file, module_types)
 
-    modules = tr.int.module_instance.get()
+    client = _client(client_id, client_password, [settings], module_types)
 
-    module = _module(modules, settings)
-    if not module:
-        template = 'Relay module "{name}" does not exist!'
-        message = template.format(**settings)
-        raise ModuleDoesNotExistError(message)
+    return client.edit(settings)
 
-    diff = _diff(module, settings)
-    if not diff:
-        template = 'Relay module "{name}" has not been changed!'
-        message = template.format(**settings)
-        raise ModuleHasNotBeenChangedError(message)
 
-    tr.int.module_instance.patch(module['id'], diff)
+@relay_command
+def remove(client_id, client_password, settings_file):
+    # The module type catalog is not checked, so that even the modules of
+    # retired types (or lacking newly required settings) can be removed.
+    settings = load_settings(settings_file)
+
+    client = _client(client_id, client_password)
 
-    template = 'Relay module "{name}" has been successfully edited!'
-    return template.format(**settings)
+    return client.remove(settings)
 
 
 @relay_command
-def remove(client_id, client_password, settings_file):
-    tr = ThreatResponse(client_id, client_password)
+def sync(client_id, client_password, settings_file):
+    module_types = _catalog().fresh()
 
-    settings = load_settings(settings_file)
+    settings = load_settings(settings_file, module_types)
 
-    modules = tr.int.module_instance.get()
+    client = _client(client_id, client_password, [settings], module_types)
 
-    module = _module(modules, settings)
-    if not module:
-        template = 'Relay module "{name}" does not exist!'
-        message = template.format(**settings)
-        raise ModuleDoesNotExistError(message)
+    return client.sync(settings)
 
-    tr.int.module_instance.delete(module['id'])
 
-    template = 'Relay module "{name}" has been successfully removed!'
-    return template.format(**settings)
+@relay_command(settings_file=False)
+def catalog(client_id, client_password):
+    client = _client(client_id, client_password)
 
+    module_types = _catalog().refresh(client)
+    if module_types is None:
+        raise ValueError('Unable to fetch the module type catalog.')
 
-def _module(modules, settings):
-    for module in modules:
-        if (
-            module['name'] == settings['name'] and
-            module['module_type_id'] == settings['module_type_id']
-        ):
-            return module
+    template = ('The module type catalog ({count} types) '
+                'has been successfully refreshed!')
+    return template.format(count=len(module_types))
 
 
-def _diff(module, settings):
-    return {
-        key: value
-        for key, value in settings.items()
-        if module[key] != value
-    }
+@relay.command()
+@click.argument(
+    'paths',
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    '-j', '--jobs',
+    type=click.IntRange(min=1),
+    default=multiprocessing.cpu_count(),
+    show_default=True,
+    help='The number of processes to validate the files with.',
+)
+@click.option(
+    '-c', '--cache_file',
+    type=click.Path(dir_okay=False),
+    default=VALIDATE_CACHE_FILE_DEFAULT,
+    show_default=True,
+    help='The path to a cache of already validated files.',
+)
+@click.option(
+    '--no_cache',
+    is_flag=True,
+    help='Validate all the files regardless of the cache.',
+)
+def validate(paths, jobs, cache_file, no_cache):
+    """
+    Validate Relay settings files (or directories of them) offline.
+    """
+    cache = ValidationCache(None if no_cache else cache_file)
+
+    total = skipped = invalid = 0
+    try:
+        reports = validate_files(
+            settings_files(paths), jobs, cache, _catalog().get()
+        )
+        for report in reports:
+            total += 1
+            skipped += report.cached
+            if report.error:
+                invalid += 1
+                error = {'file': report.file, 'error': report.error}
+                click.echo(json.dumps(error))
+    finally:
+        cache.save()
+
+    if invalid:
+        template = '{invalid} of {total} Relay settings files are invalid!'
+        message = template.format(invalid=invalid, total=total)
+        message = click.style(message, fg='red')
+        raise click.ClickException(message)
+
+    template = ('All {total} Relay settings files are valid '
+                '({skipped} unchanged since the last validation)!')
+    message = template.format(total=total, skipped=skipped)
+    message = click.style(message, fg='green')
+    click.echo(message, err=True)
+
+
+@relay.command()
+@client_id_option
+@client_password_option
+@click.argument(
+    'paths',
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    '--show_values',
+    is_flag=True,
+    help='Show the actual values of the diverged settings (may be secrets).',
+)
+@click.pass_context
+def drift(context, client_id, client_password, paths, show_values):
+    """
+    Detect Relay modules diverged from their settings files (or directories).
+    """
+    try:
+        module_types = _catalog().fresh()
+
+        settings_list = []
+        for path in settings_files(paths):
+            with io.open(path, 'r', encoding='utf-8') as settings_file:
+                try:
+                    settings_list.append(
+                        load_settings(settings_file, module_types)
+                    )
+                except SettingsValidationError as error:
+                    raise SettingsValidationError(
+                        '{}: {}'.format(path, error)
+                    )
+
+        client = _client(
+            client_id, client_password, settings_list, module_types
+        )
+
+        report = detect_drift(client.modules, settings_list, show_values)
+
+    except Exception as exception:
+        message = click.style(str(exception), fg='red')
+        raise click.ClickException(message)
+
+    click.echo(json.dumps(report, indent=2, sort_keys=True))
+
+    if report['drifted'] or report['missing']:
+        template = ('Drift detected: {drifted} drifted and {missing} missing '
+                    'of {checked} Relay modules!')
+        message = template.format(
+            drifted=len(report['drifted']),
+            missing=len(report['missing']),
+            checked=report['checked'],
+        )
+        click.echo(click.style(message, fg='red'), err=True)
+        context.exit(DRIFT_EXIT_CODE)
+
+    template = 'No drift detected in {checked} Relay modules!'
+    message = click.style(template.format(**report), fg='green')
+    click.echo(message, err=True)
+
+
+class _WarningHandler(logging.Handler):
+    # Echo the warnings (e.g. about the module type catalog) to the console.
+
+    def __init__(self):
+        super(_WarningHandler, self).__init__(logging.WARNING)
+
+    def emit(self, record):
+        message = 'Warning: {}'.format(self.format(record))
+        click.echo(click.style(message, fg='yellow'), err=True)
+
+
+def _client(client_id, client_password, settings_list=(), module_types=None):
+    """
+    Connect to Threat Response. The settings are expected to be loaded (and
+    checked) against the cached module type catalog while it is still fresh,
+    so any typos are caught before making any network calls at all.
+    Otherwise, the catalog is refreshed, and the settings are checked now.
+    """
+    client = RelayClient.connect(client_id, client_password)
+
+    if settings_list and not module_types:
+        module_types = _catalog().get(client)
+        if module_types:
+            for settings in settings_list:
+                check_module_type(settings, module_types)
+
+    return client
+
+
+def _catalog():
+    return click.get_current_context().find_object(Catalog) or Catalog()
 
 
 def main():
@@ -0,0 +1,164 @@
+import logging
+import threading
+import timeit
+
+from relay.metrics import CONCURRENCY_LIMIT
+
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter(object):
+    """
+    Limit the number of concurrent requests to an API adaptively following
+    the AIMD (additive increase/multiplicative decrease) approach:
+    1. while the requests succeed in a timely manner and the limit is actually
+    reached, the limit grows by one per each round (i.e. each `limit` of
+    requests);
+    2. as soon as a request is dropped (e.g. throttled or failed because of
+    an overloaded server) or the latency rises above `tolerance` times the
+    baseline (i.e. the lowest latency observed lately), the limit is
+    multiplied by `backoff`, at most once per each round.
+    The latency is tracked separately per each kind of requests (check the
+    `key` of `acquire`), since e.g. fetching a whole list naturally takes
+    much longer than editing a single item.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32,
+                 backoff=0.5, tolerance=2.0, smoothing=0.2):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError(
+                'Concurrency limits must satisfy: '
+                '1 <= minimum <= initial <= maximum.'
+            )
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+
+        self._limit = initial
+        self._successes = 0
+        self._in_flight = 0
+        self._epoch = 0
+        self._latencies = {}
+        self._baselines = {}
+        self._condition = threading.Condition()
+
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def acquire(self, key=None):
+        """
+        Wait for a free slot and take it. Return a token to release it with.
+        The latency of the request is compared only with the latency of the
+        other requests of the same `key` (e.g. the API method).
+        """
+        with self._condition:
+            while self._in_flight >= self._limit:
+                self._condition.wait()
+            self._in_flight += 1
+            return self._epoch, key, timeit.default_timer()
+
+    def release(self, token, dropped=False):
+        """
+        Free the slot taken and adjust the limit based on whether the request
+        has been dropped and how long it has taken.
+        """
+        epoch, key, start = token
+        latency = timeit.default_timer() - start
+
+        with self._condition:
+            # Whether at least half of the limit has actually been in use,
+            # otherwise there is no evidence that a higher limit would be
+            # fine too.
+            saturated = self._in_flight * 2 >= self._limit
+            self._in_flight -= 1
+
+            if dropped:
+                self._decrease(epoch, 'dropped request')
+            elif self._observe(key, latency):
+                self._decrease(epoch, 'rising latency')
+            elif saturated:
+                self._increase()
+
+            self._condition.notify_all()
+
+    def _observe(self, key, latency):
+        if key not in self._latencies:
+            self._latencies[key] = self._baselines[key] = latency
+            return False
+
+        smoothed = self._latencies[key]
+        smoothed += self.smoothing * (latency - smoothed)
+        baseline = self._baselines[key]
+
+        # Both the smoothed latency and the latest one must be high, so the
+        # smoothed one still decaying after a single slow request does not
+        # count as rising once the requests have become fast again.
+        threshold = self.tolerance * baseline
+        rising = smoothed > threshold and latency > threshold
+
+        # Let the baseline follow the latency up very slowly, so a permanent
+        # slowdown does not keep the limit at the minimum forever.
+        self._latencies[key] = smoothed
+        self._baselines[key] = min(
+            latency,
+            baseline + self.smoothing ** 2 * (smoothed - baseline),
+        )
+        return rising
+
+    def _increase(self):
+        self._successes += 1
+        if self._successes >= self._limit:
+            self._successes = 0
+            self._update(min(self.maximum, self._limit + 1), 'increased')
+
+    def _decrease(self, epoch, reason):
+        # The requests started before the previous decrease are not related to
+        # the current limit, so they must not make it decrease once again.
+        if epoch != self._epoch:
+            return
+
+        self._epoch += 1
+        self._successes = 0
+        limit = max(self.minimum, int(self._limit * self.backoff))
+        self._update(limit, 'decreased', reason)
+
+        # Start judging the latency afresh at the new limit.
+        self._latencies = dict(self._baselines)
+
+    def _update(self, limit, change, reason=None):
+        previous, self._limit = self._limit, limit
+        if limit != previous:
+            CONCURRENCY_LIMIT.set(limit)
+            logger.info(
+                'Concurrency limit %s from %d to %d%s.',
+                change, previous, limit,
+                ' due to {}'.format(reason) if reason else '',
+            )
+
+
+def overloaded(error):
+    """
+    Tell whether an API error means that the server is overloaded,
+    i.e. the request has been throttled or the server has failed.
+    """
+    response = getattr(error, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    return status_code is not None and (
+        status_code == 429 or status_code >= 500
+    )
+
+
+def throttled(error):
+    """
+    Tell whether an API error means that the request has been throttled,
+    so it has not been processed at all and can be safely retried.
+    """
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) == 429
@@ -1,7 +1,14 @@
+CATALOG_FILE_DEFAULT = '~/.cache/threatresponse-relay/module_types.json'
+
+CATALOG_TTL_DEFAULT = 24 * 60 * 60  # seconds
+
 CLIENT_ID_ENVVAR = 'TR_API_CLIENT_ID'
 
 CLIENT_PASSWORD_ENVVAR = 'TR_API_CLIENT_PASSWORD'
 
+# Neither 1 (for any errors) nor 2 (for usage errors, as reported by click).
+DRIFT_EXIT_CODE = 3
+
 RELAY_MODULE_SUPPORTED_APIS = (
     'health',
     'observe/observables',
@@ -12,3 +19,5 @@ RELAY_MODULE_SUPPORTED_APIS = (
 )
 
 SETTINGS_FILE_DEFAULT = 'relay_settings.json'
+
+VALIDATE_CACHE_FILE_DEFAULT = '.relay_validate_cache.json'
@@ -0,0 +1,115 @@
+import hashlib
+import json
+
+from relay.settings import settings_schema
+
+
+REDACTED = '<redacted>'
+
+
+def canonical_hash(module):
+    """
+    Hash the managed part of a module (i.e. only the keys which may be
+    specified in the Relay settings) regardless of the order of any keys.
+    Return the raw digest, since it takes half the memory of the hex one.
+    """
+    content = {key: module[key] for key in settings_schema if key in module}
+    text = json.dumps(content, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+def deep_diff(expected, actual, path=()):
+    """
+    List the differences between two (JSON-like) values recursively.
+    Each difference has a dotted `path` to the value along with the
+    `expected` and the `actual` values (a missing one is just omitted).
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in sorted(set(expected) | set(actual)):
+            if key not in actual:
+                differences.append(
+                    {'path': _path(path + (key,)), 'expected': expected[key]}
+                )
+            elif key not in expected:
+                differences.append(
+                    {'path': _path(path + (key,)), 'actual': actual[key]}
+                )
+            else:
+                differences.extend(
+                    deep_diff(expected[key], actual[key], path + (key,))
+                )
+        return differences
+
+    if expected != actual:
+        return [{'path': _path(path), 'expected': expected, 'actual': actual}]
+
+    return []
+
+
+def _path(keys):
+    return '.'.join(str(key) for key in keys)
+
+
+def redact(difference):
+    """
+    Hide the values of a difference under `settings`, since those may well be
+    secrets (e.g. expanded from the environment variables). Only the path and
+    whether each of the values is present are kept.
+    """
+    if difference['path'].split('.', 1)[0] != 'settings':
+        return difference
+
+    return {
+        key: value if key == 'path' else REDACTED
+        for key, value in difference.items()
+    }
+
+
+def detect_drift(inventory, settings_list, show_values=False):
+    """
+    Compare the live modules (i.e. the inventory of module instances, check
+    `relay.inventory.Inventory`) with the expected ones (i.e. the loaded
+    Relay settings). The modules are matched by name and type and compared
+    by their canonical hashes first, so the live modules are parsed and the
+    deep diff is computed only for the mismatching ones. Only a non-empty
+    diff counts as a drift, since the hashes may mismatch for equal values
+    too (e.g. 1.0 and 1). Unless `show_values` is set, the values under
+    `settings` are redacted (check `redact`).
+    Return a report suitable for dumping to JSON.
+    """
+    report = {'checked': 0, 'in_sync': 0, 'drifted': [], 'missing': []}
+
+    for settings in settings_list:
+        report['checked'] += 1
+
+        record = inventory.find(settings['name'], settings['module_type_id'])
+        if record is None:
+            report['missing'].append({
+                'name': settings['name'],
+                'module_type_id': settings['module_type_id'],
+            })
+            continue
+
+        if record.digest == canonical_hash(settings):
+            report['in_sync'] += 1
+            continue
+
+        module = record.module()
+        actual = {key: module[key] for key in settings if key in module}
+        differences = deep_diff(settings, actual)
+        if not differences:
+            report['in_sync'] += 1
+            continue
+
+        if not show_values:
+            differences = [redact(difference) for difference in differences]
+
+        report['drifted'].append({
+            'id': record.id,
+            'name': settings['name'],
+            'module_type_id': settings['module_type_id'],
+            'differences': differences,
+        })
+
+    return report
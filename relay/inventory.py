@@ -0,0 +1,132 @@
+import json
+
+from six.moves import intern
+
+from relay.drift import canonical_hash
+
+
+class ModuleRecord(object):
+    """
+    A compact representation of a module instance.
+    Only the fields needed for lookups (along with the canonical hash of the
+    module) are kept as attributes, the names and the types being interned,
+    since they tend to repeat a lot across the inventory. The rest of the
+    module is kept as compact JSON and parsed only on demand.
+    """
+
+    __slots__ = ('id', 'name', 'module_type_id', 'digest', '_payload')
+
+    def __init__(self, module):
+        self.id = module['id']
+        self.name = _intern(module['name'])
+        self.module_type_id = _intern(module['module_type_id'])
+        self.digest = canonical_hash(module)
+
+        rest = {
+            key: value for key, value in module.items()
+            if key not in ('id', 'name', 'module_type_id')
+        }
+        self._payload = json.dumps(rest, separators=(',', ':')).encode('utf-8')
+
+    @property
+    def key(self):
+        return self.name, self.module_type_id
+
+    def module(self):
+        """
+        Parse the full module (as returned by the API) out of the record.
+        """
+        module = json.loads(self._payload.decode('utf-8'))
+        module.update(
+            id=self.id, name=self.name, module_type_id=self.module_type_id,
+        )
+        return module
+
+    def __getitem__(self, key):
+        if key in ('id', 'name', 'module_type_id'):
+            return getattr(self, key)
+        return self.module()[key]
+
+    def __repr__(self):
+        return '<ModuleRecord {!r} ({})>'.format(self.name, self.id)
+
+
+def _intern(text):
+    # Only native strings can be interned (it matters for Python 2 only).
+    return intern(text) if isinstance(text, str) else text
+
+
+class Inventory(object):
+    """
+    The inventory of module instances indexed by name and type.
+    """
+
+    def __init__(self, modules=()):
+        self._records = {}
+        self._index = {}
+
+        for module in modules:
+            self.add(module)
+
+    @classmethod
+    def consume(cls, modules):
+        """
+        Build an inventory out of a list of modules (as returned by the API)
+        emptying the list along the way, so each module is released as soon
+        as its record is built, and the peak memory usage stays close to the
+        one of the list itself rather than the sum of both.
+        Only worth it for a list nothing else refers to (e.g. a response just
+        parsed), otherwise the modules are not released anyway. Unlike this,
+        the constructor never changes the modules it is given.
+        """
+        if not isinstance(modules, list):
+            return cls(modules)
+
+        inventory = cls()
+
+        # Popping from the end is cheap, while the order still matters.
+        modules.reverse()
+        while modules:
+            inventory.add(modules.pop())
+
+        return inventory
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(list(self._records.values()))
+
+    def find(self, name, module_type_id):
+        return self._index.get((name, module_type_id))
+
+    def add(self, module):
+        record = ModuleRecord(module)
+        self._records[record.id] = record
+        # Just like the API, the first one wins in case of any duplicates.
+        self._index.setdefault(record.key, record)
+        return record
+
+    def remove(self, record):
+        del self._records[record.id]
+
+        if self._index.get(record.key) is record:
+            del self._index[record.key]
+            # Fall back to a duplicate (if any), this is rare enough to scan.
+            for other in self._records.values():
+                if other.key == record.key:
+                    self._index[record.key] = other
+                    break
+
+    def update(self, record, diff):
+        """
+        Apply a diff to the module of a record. Return the updated record.
+        """
+        module = record.module()
+        module.update(diff)
+
+        updated = ModuleRecord(module)
+        self._records[updated.id] = updated
+        if self._index.get(record.key) is record:
+            self._index[record.key] = updated
+        return updated
@@ -0,0 +1,300 @@
+import functools
+import io
+import os
+import threading
+import timeit
+
+import six
+from six.moves import BaseHTTPServer
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Roughly from a local round trip up to a slow remote API call (in seconds).
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace('\\', r'\\')
+        .replace('\n', r'\n')
+        .replace('"', r'\"')
+    )
+
+
+def _format(name, labels, value):
+    if labels:
+        labels = ','.join(
+            '{}="{}"'.format(key, _escape(value))
+            for key, value in labels
+        )
+        name = '{}{{{}}}'.format(name, labels)
+    return '{} {}'.format(name, repr(float(value)))
+
+
+class Metric(object):
+    """
+    The base class for metrics which may have some labels attached to them.
+    Each distinct combination of label values has its own separate state.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._lock = threading.Lock()
+        self._states = {}
+
+        if registry is not None:
+            registry.register(self)
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                'Metric "{}" expects labels {}, got {}.'.format(
+                    self.name, list(self.labelnames), sorted(labels)
+                )
+            )
+        return tuple((key, labels[key]) for key in self.labelnames)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.type),
+        ]
+        lines.extend(
+            _format(name, labels, value)
+            for name, labels, value in self.samples()
+        )
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._states[key] = self._states.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._states.get(self._labels(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            states = sorted(self._states.items())
+        for labels, value in states:
+            yield self.name, labels, value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._states[key] = value
+
+    def value(self, **labels):
+        return self._states.get(self._labels(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            states = sorted(self._states.items())
+        for labels, value in states:
+            yield self.name, labels, value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None,
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(
+            name, documentation, labelnames, registry
+        )
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            state = self._states.setdefault(
+                key, {'buckets': [0] * len(self.buckets), 'count': 0,
+                      'sum': 0.0}
+            )
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][index] += 1
+            state['count'] += 1
+            state['sum'] += value
+
+    def count(self, **labels):
+        state = self._states.get(self._labels(labels))
+        return state['count'] if state else 0
+
+    def time(self, **labels):
+        """
+        Observe the duration of a block (or a function call) in seconds.
+        """
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            states = sorted(
+                (labels, dict(state, buckets=list(state['buckets'])))
+                for labels, state in self._states.items()
+            )
+        for labels, state in states:
+            for bound, value in zip(self.buckets, state['buckets']):
+                bucket = labels + (('le', repr(float(bound))),)
+                yield self.name + '_bucket', bucket, value
+            bucket = labels + (('le', '+Inf'),)
+            yield self.name + '_bucket', bucket, state['count']
+            yield self.name + '_sum', labels, state['sum']
+            yield self.name + '_count', labels, state['count']
+
+
+class _Timer(object):
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = timeit.default_timer() - self._start
+        self._histogram.observe(duration, **self._labels)
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._histogram, self._labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+
+def _replace(source, target):
+    # Unlike `os.rename`, `os.replace` overwrites the target on Windows too,
+    # but there is no such function in Python 2.
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+        return
+
+    if os.name == 'nt' and os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+
+
+class Registry(object):
+    """
+    A collection of metrics exposable in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        return ''.join(metric.render() + '\n' for metric in self._metrics)
+
+    def write(self, path):
+        """
+        Write the metrics to a file (e.g. for the node exporter's textfile
+        collector). The file is replaced atomically, so it is never read
+        half-written.
+        """
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with io.open(temp_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(six.text_type(self.render()))
+        _replace(temp_path, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Expose the metrics over HTTP in a background thread.
+        Return the server, so it can be shut down (and closed) later, and
+        the port actually chosen (e.g. for port 0) can be found out.
+        """
+        registry = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer((host, port), Handler)
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return server
+
+
+REGISTRY = Registry()
+
+API_REQUEST_DURATION = Histogram(
+    'relay_api_request_duration_seconds',
+    'Duration of the Threat Response API calls.',
+    ('api', 'method'),
+    REGISTRY,
+)
+API_REQUEST_ERRORS = Counter(
+    'relay_api_request_errors_total',
+    'Number of failed Threat Response API calls.',
+    ('api', 'method'),
+    REGISTRY,
+)
+API_REQUEST_RETRIES = Counter(
+    'relay_api_request_retries_total',
+    'Number of retried (because of being throttled) API calls.',
+    ('api', 'method'),
+    REGISTRY,
+)
+CONCURRENCY_LIMIT = Gauge(
+    'relay_concurrency_limit',
+    'Current limit on the number of concurrent API calls.',
+    (),
+    REGISTRY,
+)
+AUTH_DURATION = Histogram(
+    'relay_auth_duration_seconds',
+    'Duration of the Threat Response API client authorization.',
+    (),
+    REGISTRY,
+)
+SETTINGS_LOAD_DURATION = Histogram(
+    'relay_settings_load_duration_seconds',
+    'Duration of the Relay settings loading (parsing, validation, etc.).',
+    (),
+    REGISTRY,
+)
+MODULES_APPLIED = Counter(
+    'relay_modules_applied_total',
+    'Number of Relay modules processed by the action taken.',
+    ('action',),
+    REGISTRY,
+)
@@ -0,0 +1,149 @@
+import collections
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+class Profiler(object):
+    """
+    Profile the current thread in two complementary ways at once:
+    1. deterministically with `cProfile` timed by the CPU time of the thread
+    (so any waiting on the network or sleeping is left out, and so is the
+    sampling itself), the functions run by the sampler being stripped off
+    the stats too;
+    2. statistically by sampling the call stack of the thread on a regular
+    basis from a background thread (wall-clock time including any waiting on
+    the network), the samples being aggregated into collapsed stacks suitable
+    for building flame graphs (e.g. with `flamegraph.pl` or `speedscope`).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+
+        self._profile = cProfile.Profile(_cpu_time)
+        self._ident = None
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._ident = threading.current_thread().ident
+
+        self._sampler = threading.Thread(target=self._sample)
+        self._sampler.daemon = True
+        self._sampler.start()
+
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+        self._stopped.set()
+        self._sampler.join()
+
+    def write(self, path):
+        """
+        Write the stats to `<path>.pstats` and the stacks to
+        `<path>.collapsed`.
+        Return both paths.
+        """
+        pstats_path = path + '.pstats'
+        self._stats().dump_stats(pstats_path)
+
+        collapsed_path = path + '.collapsed'
+        with io.open(collapsed_path, 'w', encoding='utf-8') as stacks_file:
+            for stack, count in sorted(self.stacks.items()):
+                stacks_file.write(u'{} {}\n'.format(stack, count))
+
+        return pstats_path, collapsed_path
+
+    def summary(self, stream, top=20):
+        """
+        Print the top functions by the cumulative CPU time spent in them.
+        """
+        stats = self._stats()
+        stats.stream = stream
+        stats.sort_stats('cumulative').print_stats(top)
+
+    def _stats(self):
+        stats = pstats.Stats(self._profile)
+        _strip(stats, [_key(self._sample), _key(_collapse)])
+        return stats
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._ident)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+
+# Only the CPU time of the profiled thread itself must count, otherwise the
+# sampler thread has its time charged to whatever the profiled one is doing.
+# There is no `time.thread_time` before Python 3.7 though, so fall back to the
+# CPU time of the whole process (`time.clock` on Unix in Python 2), which is
+# then slightly biased by the sampling overhead.
+_cpu_time = (
+    getattr(time, 'thread_time', None) or
+    getattr(time, 'process_time', None) or
+    time.clock
+)
+
+
+def _key(function):
+    code = getattr(function, '__func__', function).__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _strip(stats, functions):
+    """
+    Remove the functions (along with all the ones called by them only) from
+    the stats, e.g. since Python 3.12 `cProfile` profiles all the threads,
+    including the sampler one.
+    """
+    removed = set(
+        function for function in functions if function in stats.stats
+    )
+
+    while removed:
+        for function in removed:
+            del stats.stats[function]
+
+        orphaned = set()
+        for function, (cc, nc, tt, ct, callers) in stats.stats.items():
+            dropped = [caller for caller in callers if caller in removed]
+            if not dropped:
+                continue
+
+            for caller in dropped:
+                ccc, cnc, ctt, cct = callers.pop(caller)
+                cc, nc, tt, ct = cc - ccc, nc - cnc, tt - ctt, ct - cct
+            stats.stats[function] = cc, nc, tt, ct, callers
+
+            if not callers:
+                orphaned.add(function)
+
+        removed = orphaned
+
+    # Recalculate the totals.
+    stats.total_calls = stats.prim_calls = 0
+    stats.total_tt = 0
+    stats.top_level = set()
+    stats.get_top_level_stats()
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        name = '{} ({}:{})'.format(
+            code.co_name, os.path.basename(code.co_filename),
+            code.co_firstlineno,
+        )
+        # Semicolons separate the frames in the collapsed format.
+        names.append(name.replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
@@ -1,4 +1,5 @@
 import json
+import logging
 import os
 import string
 
@@ -9,6 +10,10 @@ from relay.constants import (
     RELAY_MODULE_SUPPORTED_APIS,
 )
 from relay.exceptions import SettingsValidationError
+from relay.metrics import SETTINGS_LOAD_DURATION
+
+
+logger = logging.getLogger(__name__)
 
 
 settings_schema = {
@@ -65,9 +70,55 @@ def _expand(text):
     return string.Template(text).substitute(os.environ)
 
 
-def load_settings(settings_file):
+def check_module_type(settings, catalog):
+    """
+    Check the type of a Relay module and the keys of its settings against
+    the module type catalog (check `relay.catalog.Catalog`).
+    The keys unknown to the catalog are only warned about, since the catalog
+    is not guaranteed to list all the keys the API actually accepts.
+    """
+    module_type = catalog.get(settings['module_type_id'])
+    if module_type is None:
+        message = (
+            'Unknown Relay module type "{}". '
+            'Make sure the ID is correct or refresh the module type catalog '
+            'with `relay catalog`.'
+        ).format(settings['module_type_id'])
+        raise SettingsValidationError(message)
+
+    expected = module_type['settings']
+    if not expected:
+        return
+
+    missing = sorted(
+        key for key, required in expected.items()
+        if required and key not in settings['settings']
+    )
+    if missing:
+        message = (
+            'Invalid Relay settings for module type "{}". '
+            'Missing keys: {}.'
+        ).format(module_type['title'], ', '.join(missing))
+        raise SettingsValidationError(message)
+
+    # The keys defined by the schema itself are known regardless.
+    known = set(expected) | set(settings_schema['settings']['schema'])
+    unknown = sorted(set(settings['settings']) - known)
+    if unknown:
+        logger.warning(
+            'Relay settings for module type "%s" have keys unknown to '
+            'the module type catalog: %s.',
+            module_type['title'], ', '.join(unknown),
+        )
+
+
+@SETTINGS_LOAD_DURATION.time()
+def load_settings(settings_file, catalog=None):
     """
     Load (parse & validate) the Relay settings JSON from a file object.
+    If the module type catalog is given (and it is not empty), then also
+    check the type of a Relay module and the keys of its settings against it
+    (check `check_module_type`).
     """
 
     try:
@@ -98,6 +149,9 @@ def load_settings(settings_file):
         )
         raise SettingsValidationError(message)
 
+    if catalog:
+        check_module_type(settings, catalog)
+
     try:
         settings['name'] = _expand(settings['name'])
 
@@ -115,4 +169,11 @@ def load_settings(settings_file):
         ).format(key)
         raise SettingsValidationError(message)
 
+    except ValueError as error:
+        message = (
+            'Unable to expand Relay settings JSON: {}. '
+            'Make sure to escape "$" as "$$".'
+        ).format(error)
+        raise SettingsValidationError(message)
+
     return settings
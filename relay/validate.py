@@ -0,0 +1,163 @@
+import collections
+import functools
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import string
+
+import six
+
+from relay.exceptions import SettingsValidationError
+from relay.settings import load_settings
+from relay.version import __version__
+
+
+Report = collections.namedtuple('Report', ('file', 'error', 'cached'))
+
+
+class ValidationCache(object):
+    """
+    Remember the content hashes of the Relay settings files which have
+    already been successfully validated, so unchanged files can be skipped.
+    Only valid files are remembered, so errors are always reported again.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._digests = {}
+
+        if path and os.path.isfile(path):
+            try:
+                with io.open(path, 'r', encoding='utf-8') as cache_file:
+                    data = json.load(cache_file)
+                if data.get('version') == __version__:
+                    self._digests = data['files']
+            except (ValueError, KeyError, AttributeError):
+                # A broken cache is no worse than a missing one.
+                self._digests = {}
+
+    def hit(self, file, digest):
+        return self._digests.get(file) == digest
+
+    def update(self, file, digest, valid):
+        if valid:
+            self._digests[file] = digest
+        else:
+            self._digests.pop(file, None)
+
+    def save(self):
+        if not self._path:
+            return
+
+        data = {'version': __version__, 'files': self._digests}
+        with io.open(self._path, 'w', encoding='utf-8') as cache_file:
+            # Make sure to write text rather than bytes on Python 2 too.
+            cache_file.write(
+                six.text_type(json.dumps(data, indent=2, sort_keys=True))
+            )
+
+
+def _digest(text, salt=''):
+    """
+    Hash the contents of a Relay settings file along with the values of all
+    the environment variables it refers to (and some extra salt, e.g. the
+    digest of the module type catalog), since the latter may also affect the
+    result of the validation.
+    """
+    names = sorted(set(
+        match.group('named') or match.group('braced')
+        for match in string.Template.pattern.finditer(text)
+        if match.group('named') or match.group('braced')
+    ))
+    environ = [[name, os.environ.get(name)] for name in names]
+
+    digest = hashlib.sha256()
+    digest.update(text.encode('utf-8'))
+    digest.update(json.dumps(environ).encode('utf-8'))
+    digest.update(salt.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _validate(item, catalog=None):
+    # Must be a top-level function, so it can be pickled for a process pool.
+    file, text = item
+    try:
+        load_settings(io.StringIO(text), catalog)
+    except SettingsValidationError as error:
+        return file, str(error)
+    except Exception as error:
+        # One unexpectedly broken file must not fail the whole batch.
+        return file, 'Unable to validate Relay settings file: {!r}.'.format(
+            error
+        )
+    return file, None
+
+
+def settings_files(paths):
+    """
+    Expand the directories among the paths into the JSON files within them.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.json'):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def validate_files(paths, jobs=1, cache=None, catalog=None):
+    """
+    Validate (parse, check the schema & expand) lots of Relay settings files
+    spreading them over a pool of `jobs` processes. If the module type catalog
+    is given, then also check the files against it.
+    Yield a `Report` for each file as soon as it is checked, in no particular
+    order. No credentials or network access are required.
+    """
+    cache = cache or ValidationCache()
+
+    salt = hashlib.sha256(
+        json.dumps(catalog, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    validate = functools.partial(_validate, catalog=catalog)
+
+    items, digests = [], {}
+    for file in paths:
+        try:
+            with io.open(file, 'r', encoding='utf-8') as settings_file:
+                text = settings_file.read()
+        except (IOError, OSError, UnicodeDecodeError) as error:
+            cache.update(file, None, False)
+            message = 'Unable to read Relay settings file: {}.'.format(error)
+            yield Report(file, message, False)
+            continue
+
+        digest = digests[file] = _digest(text, salt)
+        if cache.hit(file, digest):
+            yield Report(file, None, True)
+        else:
+            items.append((file, text))
+
+    if not items:
+        return
+
+    if jobs > 1 and len(items) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(items)))
+        chunksize = max(1, len(items) // (jobs * 4))
+        results = pool.imap_unordered(validate, items, chunksize)
+    else:
+        pool = None
+        results = (validate(item) for item in items)
+
+    try:
+        for file, error in results:
+            cache.update(file, digests[file], error is None)
+            yield Report(file, error, False)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
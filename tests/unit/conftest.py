@@ -16,3 +16,12 @@ def env():
 
     with mock.patch('os.environ', mock_env):
         yield mock_env
+
+
+@pytest.fixture(scope='function', autouse=True)
+def catalog_file(tmpdir):
+    # Never touch the actual module type catalog of the user.
+    path = str(tmpdir.join('module_types.json'))
+
+    with mock.patch('relay.catalog.CATALOG_FILE_DEFAULT', path):
+        yield path
@@ -0,0 +1,368 @@
+import threading
+import time
+import uuid
+
+import mock
+import pytest
+
+from relay.api import Operation, RelayClient, Result, group
+from relay.constants import (
+    RELAY_MODULE_SUPPORTED_APIS,
+)
+from relay.exceptions import (
+    ModuleAlreadyExistsError,
+    ModuleDoesNotExistError,
+    ModuleHasNotBeenChangedError,
+)
+
+
+def settings_data(name='Relay'):
+    return {
+        'name': name,
+        'module_type_id': 'a14ae422-01b6-5013-9876-695ff1b0ebe0',
+        'visibility': 'org',
+        'settings': {
+            'url': 'https://relay.example.com',
+            'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+        },
+    }
+
+
+def module_data(name='Relay', **overrides):
+    module = settings_data(name)
+    module['id'] = str(uuid.uuid4())
+    module.update(overrides)
+    return module
+
+
+@pytest.fixture(scope='function')
+def tr():
+    return mock.MagicMock()
+
+
+@pytest.fixture(scope='function')
+def client(tr):
+    return RelayClient(tr)
+
+
+def test_connect():
+    with mock.patch('relay.api.ThreatResponse') as mock_tr:
+        client = RelayClient.connect('<id>', '<password>', region='eu')
+
+    mock_tr.assert_called_once_with('<id>', '<password>', region='eu')
+    assert client._tr is mock_tr.return_value
+
+
+def test_module_types_are_retried(client, tr):
+    error = Exception('429 Too Many Requests')
+    error.response = mock.Mock(status_code=429)
+    tr.int.module_type.get.side_effect = [error, []]
+    client.retry_backoff = 0
+
+    assert client.module_types() == []
+    assert tr.int.module_type.get.call_count == 2
+
+
+def test_inventory_is_fetched_once(client, tr):
+    tr.int.module_instance.get.return_value = []
+    tr.int.module_instance.post.side_effect = (
+        lambda settings: dict(settings, id=str(uuid.uuid4()))
+    )
+
+    results = [client.add(settings_data(name)) for name in 'ABC']
+
+    assert [result.action for result in results] == ['added'] * 3
+    assert [module['name'] for module in client.modules] == list('ABC')
+
+    tr.int.module_instance.get.assert_called_once_with()
+
+    client.refresh()
+    client.find(settings_data('A'))
+
+    assert tr.int.module_instance.get.call_count == 2
+
+
+def test_add_already_exists(client, tr):
+    tr.int.module_instance.get.return_value = [module_data()]
+
+    with pytest.raises(ModuleAlreadyExistsError):
+        client.add(settings_data())
+
+    tr.int.module_instance.post.assert_not_called()
+
+
+def test_edit_and_remove_do_not_exist(client, tr):
+    tr.int.module_instance.get.return_value = []
+
+    with pytest.raises(ModuleDoesNotExistError):
+        client.edit(settings_data())
+
+    with pytest.raises(ModuleDoesNotExistError):
+        client.remove(settings_data())
+
+
+def test_edit_has_not_been_changed(client, tr):
+    tr.int.module_instance.get.return_value = [module_data()]
+
+    with pytest.raises(ModuleHasNotBeenChangedError):
+        client.edit(settings_data())
+
+    tr.int.module_instance.patch.assert_not_called()
+
+
+def test_edit_ok(client, tr):
+    module = module_data(visibility='user')
+    tr.int.module_instance.get.return_value = [module]
+
+    result = client.edit(settings_data())
+
+    assert result == Result('edited', 'Relay', module['id'])
+    assert str(result) == 'Relay module "Relay" has been successfully edited!'
+
+    tr.int.module_instance.patch.assert_called_once_with(
+        module['id'], {'visibility': 'org'}
+    )
+
+    # The cached inventory reflects the changes.
+    assert client.find(settings_data())['visibility'] == 'org'
+
+
+def test_remove_ok(client, tr):
+    module = module_data()
+    tr.int.module_instance.get.return_value = [module]
+
+    result = client.remove(settings_data())
+
+    assert result == Result('removed', 'Relay', module['id'])
+
+    tr.int.module_instance.delete.assert_called_once_with(module['id'])
+
+    assert len(client.modules) == 0
+
+
+@pytest.mark.parametrize('release_modules', [False, True])
+def test_modules(client, tr, release_modules):
+    a, b = module_data('A'), module_data('B')
+    modules = [a, b]
+    tr.int.module_instance.get.return_value = modules
+    client.release_modules = release_modules
+
+    assert [record.id for record in client.modules] == [a['id'], b['id']]
+
+    # The response is only emptied on request, so nobody has to copy it.
+    assert modules == ([] if release_modules else [a, b])
+
+
+def test_sync(client, tr):
+    module = module_data('B', visibility='user')
+    unchanged = module_data('C')
+    tr.int.module_instance.get.return_value = [module, unchanged]
+
+    results = [client.sync(settings_data(name)) for name in 'ABC']
+
+    assert [result.action for result in results] == [
+        'added', 'edited', 'unchanged',
+    ]
+    assert results[2].module_id == unchanged['id']
+
+    tr.int.module_instance.post.assert_called_once_with(settings_data('A'))
+    tr.int.module_instance.patch.assert_called_once_with(
+        module['id'], {'visibility': 'org'}
+    )
+
+
+def test_group():
+    a, b = settings_data('A'), settings_data('B')
+
+    groups = group([
+        Operation('add', a),
+        Operation('remove', b),
+        Operation('edit', a),
+        Operation('sync', b),
+    ])
+
+    assert list(groups) == [
+        ('A', a['module_type_id']),
+        ('B', b['module_type_id']),
+    ]
+    assert list(groups.values()) == [
+        [Operation('add', a), Operation('edit', a)],
+        [Operation('remove', b), Operation('sync', b)],
+    ]
+
+
+def test_group_unknown_action():
+    with pytest.raises(ValueError):
+        group([Operation('refresh', settings_data())])
+
+
+def outcomes_summary(outcomes):
+    return [
+        (outcome.result and outcome.result.action, type(outcome.error))
+        for outcome in outcomes
+    ]
+
+
+def test_execute(client, tr):
+    b = module_data('B')
+    c = module_data('C')
+    tr.int.module_instance.get.return_value = [b, c]
+    tr.int.module_instance.post.side_effect = (
+        lambda settings: dict(settings, id=str(uuid.uuid4()))
+    )
+
+    operations = [
+        Operation('edit', settings_data('A')),
+        Operation('add', settings_data('A')),
+        Operation('edit', dict(settings_data('A'), visibility='user')),
+        Operation('sync', dict(settings_data('B'), visibility='user')),
+        Operation('edit', settings_data('B')),
+        Operation('edit', dict(settings_data('B'), visibility='global')),
+        Operation('remove', settings_data('C')),
+    ]
+
+    outcomes = client.execute(operations)
+
+    # One outcome per each given operation, just as if performed in turn.
+    assert [outcome.operation for outcome in outcomes] == operations
+    assert outcomes_summary(outcomes) == [
+        (None, ModuleDoesNotExistError),
+        ('added', type(None)),
+        ('edited', type(None)),
+        ('edited', type(None)),
+        ('edited', type(None)),
+        ('edited', type(None)),
+        ('removed', type(None)),
+    ]
+    assert outcomes[1].result.module_id == outcomes[2].result.module_id
+
+    # Still, the consecutive operations are merged into single API calls.
+    tr.int.module_instance.get.assert_called_once_with()
+    tr.int.module_instance.post.assert_called_once_with(
+        dict(settings_data('A'), visibility='user')
+    )
+    tr.int.module_instance.patch.assert_called_once_with(
+        b['id'], {'visibility': 'global'}
+    )
+    tr.int.module_instance.delete.assert_called_once_with(c['id'])
+
+
+def test_execute_add_already_exists(client, tr):
+    module = module_data()
+    tr.int.module_instance.get.return_value = [module]
+
+    outcomes = client.execute([
+        Operation('add', settings_data()),
+        Operation('edit', dict(settings_data(), visibility='user')),
+    ])
+
+    # The addition fails, but the edit is not lost along with it.
+    assert outcomes_summary(outcomes) == [
+        (None, ModuleAlreadyExistsError),
+        ('edited', type(None)),
+    ]
+
+    tr.int.module_instance.post.assert_not_called()
+    tr.int.module_instance.patch.assert_called_once_with(
+        module['id'], {'visibility': 'user'}
+    )
+
+
+def test_execute_reverted_edits(client, tr):
+    module = module_data()
+    tr.int.module_instance.get.return_value = [module]
+
+    outcomes = client.execute([
+        Operation('edit', dict(settings_data(), visibility='user')),
+        Operation('edit', settings_data()),
+        Operation('edit', settings_data()),
+        Operation('sync', settings_data()),
+    ])
+
+    assert outcomes_summary(outcomes) == [
+        ('edited', type(None)),
+        ('edited', type(None)),
+        (None, ModuleHasNotBeenChangedError),
+        ('unchanged', type(None)),
+    ]
+
+    # The edits cancel each other out, so there is nothing to patch at all.
+    tr.int.module_instance.patch.assert_not_called()
+
+
+def test_execute_remove_and_add(client, tr):
+    module = module_data()
+    tr.int.module_instance.get.return_value = [module]
+    tr.int.module_instance.post.side_effect = (
+        lambda settings: dict(settings, id=str(uuid.uuid4()))
+    )
+
+    outcomes = client.execute([
+        Operation('sync', dict(settings_data(), visibility='user')),
+        Operation('remove', settings_data()),
+        Operation('remove', settings_data()),
+        Operation('sync', settings_data()),
+    ])
+
+    assert outcomes_summary(outcomes) == [
+        ('edited', type(None)),
+        ('removed', type(None)),
+        (None, ModuleDoesNotExistError),
+        ('added', type(None)),
+    ]
+
+    tr.int.module_instance.patch.assert_called_once_with(
+        module['id'], {'visibility': 'user'}
+    )
+    tr.int.module_instance.delete.assert_called_once_with(module['id'])
+    tr.int.module_instance.post.assert_called_once_with(settings_data())
+
+
+def test_execute_api_error(client, tr):
+    tr.int.module_instance.get.return_value = []
+    tr.int.module_instance.post.side_effect = RuntimeError('Oops!')
+
+    outcomes = client.execute([
+        Operation('add', settings_data()),
+        Operation('edit', dict(settings_data(), visibility='user')),
+        Operation('remove', settings_data()),
+    ])
+
+    # Once the merged call fails, the operations are performed one by one.
+    assert outcomes_summary(outcomes) == [
+        (None, RuntimeError),
+        (None, ModuleDoesNotExistError),
+        (None, ModuleDoesNotExistError),
+    ]
+
+    assert tr.int.module_instance.post.call_count == 2
+    tr.int.module_instance.post.assert_called_with(settings_data())
+
+
+def test_execute_concurrently(client, tr):
+    tr.int.module_instance.get.return_value = [
+        module_data(name, visibility='user') for name in 'ABCD'
+    ]
+
+    barrier = threading.Event()
+    calls = []
+
+    def patch(module_id, diff):
+        calls.append(module_id)
+        # Only get through when all the modules are being edited at once.
+        if len(calls) == 4:
+            barrier.set()
+        assert barrier.wait(1)
+        time.sleep(0.01)
+
+    tr.int.module_instance.patch.side_effect = patch
+
+    # The limiter lets 4 concurrent calls through from the very beginning.
+    assert client.limiter.limit == 4
+
+    outcomes = client.execute(
+        [Operation('edit', settings_data(name)) for name in 'ABCD']
+    )
+
+    assert [outcome.error for outcome in outcomes] == [None] * 4
+    assert [outcome.result.name for outcome in outcomes] == list('ABCD')
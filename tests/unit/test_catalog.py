@@ -0,0 +1,304 @@
+import json
+import os
+import time
+
+import mock
+import pytest
+from click.testing import CliRunner
+
+from relay.catalog import Catalog
+from relay.cli import relay
+from relay.constants import (
+    CLIENT_ID_ENVVAR,
+    CLIENT_PASSWORD_ENVVAR,
+    DRIFT_EXIT_CODE,
+    RELAY_MODULE_SUPPORTED_APIS,
+    SETTINGS_FILE_DEFAULT,
+)
+
+
+MODULE_TYPE_ID = 'a14ae422-01b6-5013-9876-695ff1b0ebe0'
+
+
+def module_types_data():
+    return [
+        {
+            'id': MODULE_TYPE_ID,
+            'title': 'Generic Serverless Relay',
+            'configuration_spec': [
+                {'key': 'url', 'type': 'url', 'required': True},
+                {'key': 'supported-apis', 'type': 'supported_apis',
+                 'required': True},
+                {'key': 'auth-type', 'type': 'string', 'required': False},
+            ],
+        },
+        {'title': 'Broken'},
+    ]
+
+
+def catalog_data():
+    return {
+        MODULE_TYPE_ID: {
+            'title': 'Generic Serverless Relay',
+            'settings': {
+                'url': True,
+                'supported-apis': True,
+                'auth-type': False,
+            },
+        },
+    }
+
+
+@pytest.fixture(scope='function')
+def client():
+    client = mock.MagicMock()
+    client.module_types.return_value = module_types_data()
+    return client
+
+
+def test_get_missing():
+    assert Catalog().get() is None
+
+
+def test_refresh(client, catalog_file):
+    catalog = Catalog()
+
+    assert catalog.refresh(client) == catalog_data()
+    assert catalog.get() == catalog_data()
+
+    with open(catalog_file) as cache_file:
+        assert json.load(cache_file)['module_types'] == catalog_data()
+
+
+@pytest.mark.parametrize('response', [{'error': 'Oops!'}, [], [{}]])
+def test_refresh_unexpected_response(client, catalog_file, response):
+    client.module_types.return_value = response
+
+    assert Catalog().refresh(client) is None
+    assert Catalog().get() is None
+
+
+def test_get_ttl(client):
+    catalog = Catalog(ttl=60)
+
+    assert catalog.get(client) == catalog_data()
+    assert catalog.get(client) == catalog_data()
+
+    client.module_types.assert_called_once_with()
+
+    assert catalog.fresh() == catalog_data()
+
+    with mock.patch('time.time', return_value=time.time() + 61):
+        assert catalog.fresh() is None
+
+        # Without a client even an expired catalog is better than none.
+        assert catalog.get() == catalog_data()
+
+        client.module_types.return_value = []
+        assert catalog.get(client) == catalog_data()
+
+    assert client.module_types.call_count == 2
+
+
+def test_get_refresh_error(client, caplog):
+    client.module_types.side_effect = Exception('403 Forbidden: module_type')
+
+    # Neither a missing catalog nor a stale one prevents anything from working.
+    assert Catalog().get(client) is None
+
+    client.module_types.side_effect = None
+    Catalog().refresh(client)
+    client.module_types.side_effect = Exception('403 Forbidden: module_type')
+
+    with mock.patch('time.time', return_value=time.time() + 86401):
+        assert Catalog().get(client) == catalog_data()
+
+    assert [record.getMessage() for record in caplog.records] == [
+        'Unable to refresh the module type catalog: 403 Forbidden: module_type'
+    ] * 2
+
+
+def settings_data(**overrides):
+    settings = {
+        'name': '$NAME',
+        'module_type_id': MODULE_TYPE_ID,
+        'visibility': 'org',
+        'settings': {
+            'url': '$URL',
+            'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+        },
+    }
+    settings.update(overrides)
+    return settings
+
+
+@pytest.fixture(scope='function')
+def runner(client):
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        Catalog().refresh(client)
+
+        yield runner
+
+
+def test_invoke_relay_command_unknown_module_type(env, runner):
+    settings = settings_data(module_type_id='a14ae422-typo')
+
+    with open(SETTINGS_FILE_DEFAULT, 'w') as settings_file:
+        settings_file.write(json.dumps(settings))
+
+    with mock.patch('relay.api.ThreatResponse') as mock_tr:
+        result = runner.invoke(relay, ['add'])
+
+    assert result.exit_code == 1
+    assert result.output.startswith(
+        'Error: Unknown Relay module type "a14ae422-typo".'
+    )
+
+    # The catalog is fresh, so not even the authorization is attempted.
+    mock_tr.assert_not_called()
+
+
+def test_invoke_relay_command_unknown_module_type_stale(env, runner,
+                                                        catalog_file):
+    settings = settings_data(module_type_id='a14ae422-typo')
+
+    with open(SETTINGS_FILE_DEFAULT, 'w') as settings_file:
+        settings_file.write(json.dumps(settings))
+
+    with mock.patch('relay.api.ThreatResponse') as mock_tr, \
+            mock.patch('time.time', return_value=time.time() + 86401):
+        module_type = mock_tr.return_value.int.module_type
+        module_type.get.return_value = module_types_data()
+
+        result = runner.invoke(relay, ['add'])
+
+    assert result.exit_code == 1
+    assert result.output.startswith(
+        'Error: Unknown Relay module type "a14ae422-typo".'
+    )
+
+    # The stale catalog is refreshed first, but the inventory is not fetched.
+    module_type.get.assert_called_once_with()
+    mock_tr.return_value.int.module_instance.get.assert_not_called()
+
+
+@pytest.mark.parametrize('retired', [True, False])
+def test_invoke_remove_not_in_catalog(env, runner, client, retired):
+    settings = settings_data()
+
+    if retired:
+        settings['module_type_id'] = '<retired id>'
+    else:
+        # The module type has got a new required setting since.
+        module_types = module_types_data()
+        module_types[0]['configuration_spec'].append(
+            {'key': 'token', 'type': 'string', 'required': True}
+        )
+        client.module_types.return_value = module_types
+        Catalog().refresh(client)
+
+    with open(SETTINGS_FILE_DEFAULT, 'w') as settings_file:
+        settings_file.write(json.dumps(settings))
+
+    with mock.patch('relay.api.ThreatResponse') as mock_tr:
+        module_instance = mock_tr.return_value.int.module_instance
+        module_instance.get.return_value = [{
+            'name': env['NAME'],
+            'module_type_id': settings['module_type_id'],
+            'visibility': 'org',
+            'settings': {'url': env['URL']},
+            'id': '<id>',
+        }]
+
+        result = runner.invoke(relay, ['remove'])
+
+    # Even the modules of retired types (or lacking newly required settings)
+    # must still be removable.
+    assert result.exit_code == 0
+    assert 'has been successfully removed!' in result.output
+    module_instance.delete.assert_called_once_with('<id>')
+
+
+def test_invoke_drift_reads_catalog_once(env, runner):
+    os.mkdir('modules')
+    for name in ('a', 'b', 'c'):
+        path = os.path.join('modules', '{}.json'.format(name))
+        with open(path, 'w') as settings_file:
+            settings_file.write(json.dumps(settings_data(name=name)))
+
+    with mock.patch('relay.api.ThreatResponse') as mock_tr, \
+            mock.patch.object(Catalog, '_read', autospec=True,
+                              side_effect=Catalog._read) as read:
+        mock_tr.return_value.int.module_instance.get.return_value = []
+
+        result = runner.invoke(relay, ['drift', 'modules'])
+
+    assert result.exit_code == DRIFT_EXIT_CODE
+    assert 'Drift detected: 0 drifted and 3 missing of 3' in result.output
+
+    # The catalog is fresh, so it is read (and parsed) only once per command.
+    read.assert_called_once_with(mock.ANY)
+
+
+@pytest.mark.parametrize('module_types', [
+    mock.Mock(side_effect=Exception('403 Forbidden: module_type')),
+    mock.Mock(return_value=[]),
+])
+def test_invoke_relay_command_catalog_unavailable(env, catalog_file,
+                                                  module_types):
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        with open(SETTINGS_FILE_DEFAULT, 'w') as settings_file:
+            settings_file.write(json.dumps(settings_data()))
+
+        with mock.patch('relay.api.ThreatResponse') as mock_tr:
+            mock_tr.return_value.int.module_type.get = module_types
+            module_instance = mock_tr.return_value.int.module_instance
+            module_instance.get.return_value = []
+
+            result = runner.invoke(relay, ['add'])
+
+    # The catalog is only a way to fail fast, so the command still works.
+    assert result.exit_code == 0
+    assert 'Unable to refresh the module type catalog' in result.output
+    module_instance.post.assert_called_once_with(mock.ANY)
+
+
+def test_invoke_validate_unknown_settings(env, runner):
+    settings = settings_data()
+    settings['settings'].update({'token': '<token>'})
+
+    with open(SETTINGS_FILE_DEFAULT, 'w') as settings_file:
+        settings_file.write(json.dumps(settings))
+
+    result = runner.invoke(relay, ['validate', SETTINGS_FILE_DEFAULT])
+
+    # The catalog may not list all the keys the API actually accepts.
+    assert result.exit_code == 0
+    assert (
+        'Relay settings for module type "Generic Serverless Relay" have keys '
+        'unknown to the module type catalog: token.'
+    ) in result.output
+
+
+def test_invoke_catalog(env, runner, catalog_file):
+    with mock.patch('relay.api.ThreatResponse') as mock_tr:
+        module_type = mock_tr.return_value.int.module_type
+        module_type.get.return_value = module_types_data() * 2 + [
+            {'id': '<another id>'},
+        ]
+
+        result = runner.invoke(relay, ['catalog'])
+
+    assert result.exit_code == 0
+    assert result.output == (
+        'The module type catalog (2 types) has been successfully refreshed!\n'
+    )
+
+    mock_tr.assert_called_once_with(env[CLIENT_ID_ENVVAR],
+                                    env[CLIENT_PASSWORD_ENVVAR])
+
+    assert set(Catalog().get()) == {MODULE_TYPE_ID, '<another id>'}
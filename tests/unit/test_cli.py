@@ -39,8 +39,11 @@ def runner():
 
 @pytest.fixture(scope='function')
 def tr():
-    with mock.patch('relay.cli.ThreatResponse') as mock_tr:
+    with mock.patch('relay.api.ThreatResponse') as mock_tr:
         mock_tr.instance = mock_tr.return_value = mock.MagicMock()
+        mock_tr.instance.int.module_type.get.return_value = [
+            {'id': settings_data()['module_type_id'], 'title': 'Relay'},
+        ]
         yield mock_tr
 
 
@@ -74,8 +77,8 @@ def test_invoke_relay_command_settings_loading_error(env, runner, tr, command):
     assert result.exit_code == 1
     assert result.output == 'Error: {message}\n'.format(message=message)
 
-    tr.assert_called_once_with(env[CLIENT_ID_ENVVAR],
-                               env[CLIENT_PASSWORD_ENVVAR])
+    # The settings are loaded before making any network calls.
+    tr.assert_not_called()
 
 
 def test_invoke_relay_command_processing_error(env, runner, tr, command):
@@ -0,0 +1,212 @@
+import threading
+import time
+import uuid
+
+import mock
+import pytest
+
+from relay.api import Operation, RelayClient
+from relay.concurrency import AdaptiveLimiter, overloaded, throttled
+from relay.constants import RELAY_MODULE_SUPPORTED_APIS
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status_code):
+        super(HTTPError, self).__init__(status_code)
+        self.response = type('Response', (), {'status_code': status_code})
+
+
+def test_overloaded_and_throttled():
+    assert overloaded(HTTPError(429)) and throttled(HTTPError(429))
+    assert overloaded(HTTPError(503)) and not throttled(HTTPError(503))
+    assert not overloaded(HTTPError(404)) and not throttled(HTTPError(404))
+    assert not overloaded(ValueError()) and not throttled(ValueError())
+
+
+def test_limiter_bounds():
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(initial=8, maximum=4)
+
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(initial=1, minimum=2)
+
+
+def saturate(limiter, dropped=False):
+    tokens = [limiter.acquire() for _ in range(limiter.limit)]
+    for token in tokens:
+        limiter.release(token, dropped)
+
+
+def keep_busy(limiter, requests):
+    tokens = []
+    for _ in range(requests):
+        while len(tokens) < limiter.limit:
+            tokens.append(limiter.acquire())
+        limiter.release(tokens.pop(0))
+    for token in tokens:
+        limiter.release(token)
+
+
+def test_limiter_increases_additively():
+    limiter = AdaptiveLimiter(initial=2, maximum=4, tolerance=float('inf'))
+
+    keep_busy(limiter, 2)
+    assert limiter.limit == 3
+
+    keep_busy(limiter, 3)
+    assert limiter.limit == 4
+
+    keep_busy(limiter, 10)
+    assert limiter.limit == 4
+
+
+def test_limiter_does_not_increase_unless_saturated():
+    limiter = AdaptiveLimiter(initial=4, tolerance=float('inf'))
+
+    for _ in range(10):
+        limiter.release(limiter.acquire())
+
+    assert limiter.limit == 4
+
+
+def test_limiter_decreases_multiplicatively_once_per_round(caplog):
+    limiter = AdaptiveLimiter(initial=16, minimum=3)
+
+    with caplog.at_level('INFO', logger='relay.concurrency'):
+        # All the dropped requests of a round make the limit decrease once.
+        saturate(limiter, dropped=True)
+        assert limiter.limit == 8
+
+        saturate(limiter, dropped=True)
+        assert limiter.limit == 4
+
+        saturate(limiter, dropped=True)
+        assert limiter.limit == 3
+
+    assert [record.getMessage() for record in caplog.records] == [
+        'Concurrency limit decreased from 16 to 8 due to dropped request.',
+        'Concurrency limit decreased from 8 to 4 due to dropped request.',
+        'Concurrency limit decreased from 4 to 3 due to dropped request.',
+    ]
+
+
+def test_limiter_decreases_on_rising_latency():
+    limiter = AdaptiveLimiter(initial=8, smoothing=1.0)
+
+    limiter.release(limiter.acquire())
+
+    token = limiter.acquire()
+    time.sleep(0.05)
+    limiter.release(token)
+
+    assert limiter.limit == 4
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize('keys', [(None, None), ('get', 'post')])
+def test_limiter_does_not_decrease_on_falling_latency(caplog, keys):
+    slow_key, fast_key = keys
+    limiter = AdaptiveLimiter(initial=4, tolerance=2.0)
+    clock = FakeClock()
+
+    with mock.patch('timeit.default_timer', clock), \
+            caplog.at_level('INFO', logger='relay.concurrency'):
+        # E.g. the whole inventory is fetched first...
+        token = limiter.acquire(slow_key)
+        clock.now += 0.3
+        limiter.release(token)
+
+        # ...and then lots of single modules are edited much faster.
+        for _ in range(10):
+            token = limiter.acquire(fast_key)
+            clock.now += 0.01
+            limiter.release(token)
+
+    assert limiter.limit == 4
+    assert caplog.records == []
+
+
+class FakeServer(object):
+    """
+    Imitate the module instance API able to handle at most `capacity`
+    concurrent requests, throttling any excess ones.
+    """
+
+    def __init__(self, capacity, latency=0.005):
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = self.peak = self.throttled = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        return []
+
+    def post(self, settings):
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.throttled += 1
+                raise HTTPError(429)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+        time.sleep(self.latency)
+
+        with self._lock:
+            self.in_flight -= 1
+
+        return dict(settings, id=str(uuid.uuid4()))
+
+
+class FakeThreatResponse(object):
+
+    def __init__(self, server):
+        self.int = type('IntAPI', (), {'module_instance': server})
+
+
+def operations(count):
+    return [
+        Operation('add', {
+            'name': str(uuid.uuid4()),
+            'module_type_id': 'a14ae422-01b6-5013-9876-695ff1b0ebe0',
+            'visibility': 'org',
+            'settings': {
+                'url': 'https://relay.example.com',
+                'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+            },
+        })
+        for _ in range(count)
+    ]
+
+
+def test_execute_adapts_to_server_capacity():
+    server = FakeServer(capacity=4)
+    limiter = AdaptiveLimiter(initial=16, maximum=32, tolerance=float('inf'))
+
+    client = RelayClient(FakeThreatResponse(server), limiter)
+    client.retries = 10
+    client.retry_backoff = 0.001
+
+    outcomes = client.execute(operations(200))
+
+    assert [outcome.error for outcome in outcomes] == [None] * 200
+    assert server.throttled > 0
+    assert limiter.limit <= 2 * server.capacity
+
+    # Once the server gets more capacity, the limit follows it up.
+    server.capacity = 16
+    server.throttled = 0
+
+    outcomes = client.execute(operations(400))
+
+    assert [outcome.error for outcome in outcomes] == [None] * 400
+    assert server.peak > 4
+    assert limiter.limit > 4
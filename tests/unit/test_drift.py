@@ -0,0 +1,236 @@
+import json
+import os
+import uuid
+
+import mock
+import pytest
+from click.testing import CliRunner
+
+from relay.cli import relay
+from relay.constants import (
+    DRIFT_EXIT_CODE,
+    RELAY_MODULE_SUPPORTED_APIS,
+)
+from relay.drift import REDACTED, canonical_hash, deep_diff, detect_drift
+from relay.inventory import Inventory
+
+
+def settings_data(name='Relay'):
+    return {
+        'name': name,
+        'module_type_id': 'a14ae422-01b6-5013-9876-695ff1b0ebe0',
+        'visibility': 'org',
+        'settings': {
+            'url': 'https://relay.example.com',
+            'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+        },
+    }
+
+
+def module_data(name='Relay'):
+    module = settings_data(name)
+    module['id'] = str(uuid.uuid4())
+    module['created_at'] = '2020-01-01T00:00:00.000Z'
+    return module
+
+
+def test_canonical_hash():
+    settings = settings_data()
+    module = module_data()
+
+    # Neither the unmanaged keys nor the order of any keys matter.
+    reordered = json.loads(
+        json.dumps(settings),
+        object_pairs_hook=lambda pairs: dict(reversed(pairs)),
+    )
+    assert canonical_hash(module) == canonical_hash(settings)
+    assert canonical_hash(reordered) == canonical_hash(settings)
+
+    settings['settings']['url'] = 'https://another.example.com'
+    assert canonical_hash(module) != canonical_hash(settings)
+
+
+def test_deep_diff():
+    expected = {'a': 1, 'b': {'c': [1, 2], 'd': 'x'}, 'e': True}
+    actual = {'a': 1, 'b': {'c': [2, 1], 'f': 'y'}}
+
+    assert deep_diff(expected, actual) == [
+        {'path': 'b.c', 'expected': [1, 2], 'actual': [2, 1]},
+        {'path': 'b.d', 'expected': 'x'},
+        {'path': 'b.f', 'actual': 'y'},
+        {'path': 'e', 'expected': True},
+    ]
+    assert deep_diff(expected, expected) == []
+
+
+def test_detect_drift():
+    a, b = module_data('A'), module_data('B')
+    b['settings']['url'] = 'https://manually.edited.com'
+
+    report = detect_drift(
+        Inventory([a, b, module_data('Unmanaged')]),
+        [settings_data(name) for name in 'ABC'],
+        show_values=True,
+    )
+
+    assert report == {
+        'checked': 3,
+        'in_sync': 1,
+        'drifted': [{
+            'id': b['id'],
+            'name': 'B',
+            'module_type_id': b['module_type_id'],
+            'differences': [{
+                'path': 'settings.url',
+                'expected': 'https://relay.example.com',
+                'actual': 'https://manually.edited.com',
+            }],
+        }],
+        'missing': [{'name': 'C', 'module_type_id': b['module_type_id']}],
+    }
+
+
+def test_detect_drift_redacted():
+    module = module_data()
+    module['visibility'] = 'user'
+    module['settings']['authorization-header'] = 'Bearer <secret>'
+    del module['settings']['url']
+
+    report = detect_drift(Inventory([module]), [settings_data()])
+
+    assert report['drifted'][0]['differences'] == [
+        {'path': 'settings.authorization-header', 'actual': REDACTED},
+        {'path': 'settings.url', 'expected': REDACTED},
+        {'path': 'visibility', 'expected': 'org', 'actual': 'user'},
+    ]
+
+
+def test_detect_drift_equal_values():
+    module, settings = module_data(), settings_data()
+    module['settings']['timeout'] = 1.0
+    settings['settings']['timeout'] = 1
+
+    inventory = Inventory([module])
+
+    # The canonical hashes mismatch, but the values are still equal.
+    record = inventory.find(settings['name'], settings['module_type_id'])
+    assert record.digest != canonical_hash(settings)
+
+    report = detect_drift(inventory, [settings])
+
+    assert report == {'checked': 1, 'in_sync': 1, 'drifted': [], 'missing': []}
+
+
+@pytest.fixture(scope='function')
+def runner():
+    runner = CliRunner(mix_stderr=False)
+
+    with runner.isolated_filesystem():
+        os.mkdir('settings')
+
+        for name in 'AB':
+            path = os.path.join('settings', '{}.json'.format(name))
+            with open(path, 'w') as settings_file:
+                settings_file.write(json.dumps(settings_data(name)))
+
+        yield runner
+
+
+@pytest.fixture(scope='function')
+def tr():
+    with mock.patch('relay.api.ThreatResponse') as mock_tr:
+        mock_tr.instance = mock_tr.return_value = mock.MagicMock()
+        mock_tr.instance.int.module_type.get.return_value = [
+            {'id': settings_data()['module_type_id'], 'title': 'Relay'},
+        ]
+        yield mock_tr
+
+
+def test_invoke_drift_ok(env, runner, tr):
+    tr.instance.int.module_instance.get.return_value = [
+        module_data(name) for name in 'AB'
+    ]
+
+    result = runner.invoke(relay, ['drift', 'settings'])
+
+    assert result.exit_code == 0
+    assert json.loads(result.stdout) == {
+        'checked': 2, 'in_sync': 2, 'drifted': [], 'missing': [],
+    }
+    assert result.stderr == 'No drift detected in 2 Relay modules!\n'
+
+    tr.instance.int.module_instance.get.assert_called_once_with()
+
+
+def test_invoke_drift_detected(env, runner, tr):
+    module = module_data('A')
+    module['visibility'] = 'user'
+    tr.instance.int.module_instance.get.return_value = [module]
+
+    result = runner.invoke(relay, ['drift', 'settings'])
+
+    assert result.exit_code == DRIFT_EXIT_CODE
+
+    report = json.loads(result.stdout)
+    assert [drifted['id'] for drifted in report['drifted']] == [module['id']]
+    assert report['drifted'][0]['differences'] == [
+        {'path': 'visibility', 'expected': 'org', 'actual': 'user'},
+    ]
+    assert report['missing'] == [
+        {'name': 'B', 'module_type_id': module['module_type_id']},
+    ]
+    assert result.stderr == (
+        'Drift detected: 1 drifted and 1 missing of 2 Relay modules!\n'
+    )
+
+
+def test_invoke_drift_show_values(env, runner, tr):
+    module = module_data('A')
+    module['settings']['url'] = 'https://manually.edited.com'
+    tr.instance.int.module_instance.get.return_value = [
+        module, module_data('B'),
+    ]
+
+    result = runner.invoke(relay, ['drift', 'settings'])
+
+    assert result.exit_code == DRIFT_EXIT_CODE
+    assert json.loads(result.stdout)['drifted'][0]['differences'] == [
+        {'path': 'settings.url', 'expected': REDACTED, 'actual': REDACTED},
+    ]
+    assert 'https://manually.edited.com' not in result.stdout
+
+    result = runner.invoke(relay, ['drift', '--show_values', 'settings'])
+
+    assert result.exit_code == DRIFT_EXIT_CODE
+    assert json.loads(result.stdout)['drifted'][0]['differences'] == [{
+        'path': 'settings.url',
+        'expected': 'https://relay.example.com',
+        'actual': 'https://manually.edited.com',
+    }]
+
+
+@pytest.mark.parametrize('args', [['drift'], ['drift', 'nonexistent']])
+def test_invoke_drift_usage_error(env, runner, tr, args):
+    result = runner.invoke(relay, args)
+
+    # Usage errors must not be mistaken for a detected drift.
+    assert result.exit_code == 2
+    assert result.exit_code != DRIFT_EXIT_CODE
+
+    tr.assert_not_called()
+
+
+def test_invoke_drift_settings_loading_error(env, runner, tr):
+    path = os.path.join('settings', 'B.json')
+    with open(path, 'w') as settings_file:
+        settings_file.write('Hello, World!')
+
+    result = runner.invoke(relay, ['drift', 'settings'])
+
+    assert result.exit_code == 1
+    assert result.stderr == (
+        'Error: {}: Unable to load Relay settings JSON file. '
+        'It may be malformed.\n'.format(path)
+    )
+
+    tr.instance.int.module_instance.get.assert_not_called()
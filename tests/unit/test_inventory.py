@@ -0,0 +1,86 @@
+import uuid
+
+from relay.constants import RELAY_MODULE_SUPPORTED_APIS
+from relay.drift import canonical_hash
+from relay.inventory import Inventory, ModuleRecord
+
+
+def module_data(name='Relay'):
+    return {
+        'id': str(uuid.uuid4()),
+        'name': name,
+        'module_type_id': 'a14ae422-01b6-5013-9876-695ff1b0ebe0',
+        'visibility': 'org',
+        'settings': {
+            'url': 'https://relay.example.com',
+            'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+        },
+        'created_at': '2020-01-01T00:00:00.000Z',
+    }
+
+
+def test_module_record():
+    module = module_data()
+
+    record = ModuleRecord(module)
+
+    assert not hasattr(record, '__dict__')
+    assert (record.id, record.name, record.module_type_id) == (
+        module['id'], module['name'], module['module_type_id'],
+    )
+    assert record.digest == canonical_hash(module)
+    assert record.module() == module
+    assert record['settings'] == module['settings']
+
+    # Each call parses the module afresh, so it is safe to mutate the result.
+    record.module()['settings']['url'] = '<another URL>'
+    assert record.module() == module
+
+
+def test_module_record_interning():
+    a, b = module_data('A'), module_data('A')
+    a['module_type_id'] = ''.join(list(a['module_type_id']))
+
+    assert a['module_type_id'] is not b['module_type_id']
+    assert ModuleRecord(a).module_type_id is ModuleRecord(b).module_type_id
+    assert ModuleRecord(a).name is ModuleRecord(b).name
+
+
+def test_inventory():
+    a, b, duplicate = module_data('A'), module_data('B'), module_data('A')
+
+    inventory = Inventory([a, b, duplicate])
+
+    assert len(inventory) == 3
+    assert sorted(record.id for record in inventory) == sorted(
+        module['id'] for module in (a, b, duplicate)
+    )
+
+    record = inventory.find('A', a['module_type_id'])
+    assert record.id == a['id']
+    assert inventory.find('C', a['module_type_id']) is None
+
+    updated = inventory.update(record, {'visibility': 'user'})
+    assert updated.module() == dict(a, visibility='user')
+    assert updated.digest != record.digest
+    assert inventory.find('A', a['module_type_id']) is updated
+
+    inventory.remove(updated)
+    assert len(inventory) == 2
+    assert inventory.find('A', a['module_type_id']).id == duplicate['id']
+
+    record = inventory.add(module_data('C'))
+    assert inventory.find('C', a['module_type_id']) is record
+
+
+def test_inventory_consume():
+    a, b, duplicate = module_data('A'), module_data('B'), module_data('A')
+    modules = [a, b, duplicate]
+
+    inventory = Inventory.consume(modules)
+
+    # The modules are released along the way, but the order still matters.
+    assert modules == []
+    assert len(inventory) == 3
+    assert inventory.find('A', a['module_type_id']).id == a['id']
+    assert inventory.find('B', b['module_type_id']).id == b['id']
@@ -0,0 +1,169 @@
+import json
+import os
+
+import mock
+import pytest
+from click.testing import CliRunner
+from six.moves.urllib.request import urlopen
+
+from relay.cli import relay
+from relay.constants import (
+    RELAY_MODULE_SUPPORTED_APIS,
+    SETTINGS_FILE_DEFAULT,
+)
+from relay.metrics import Counter, Histogram, Registry
+
+
+@pytest.fixture(scope='function')
+def registry():
+    registry = Registry()
+
+    counter = Counter('test_calls_total', 'Number of calls.', ('method',),
+                      registry)
+    counter.inc(method='get')
+    counter.inc(2, method='post')
+
+    histogram = Histogram('test_duration_seconds', 'Duration of calls.',
+                          registry=registry, buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    return registry
+
+
+def test_render(registry):
+    assert registry.render() == (
+        '# HELP test_calls_total Number of calls.\n'
+        '# TYPE test_calls_total counter\n'
+        'test_calls_total{method="get"} 1.0\n'
+        'test_calls_total{method="post"} 2.0\n'
+        '# HELP test_duration_seconds Duration of calls.\n'
+        '# TYPE test_duration_seconds histogram\n'
+        'test_duration_seconds_bucket{le="0.1"} 1.0\n'
+        'test_duration_seconds_bucket{le="1.0"} 2.0\n'
+        'test_duration_seconds_bucket{le="+Inf"} 3.0\n'
+        'test_duration_seconds_sum 5.55\n'
+        'test_duration_seconds_count 3.0\n'
+    )
+
+
+def test_labels_mismatch(registry):
+    counter = Counter('test_total', 'Test.', ('method',))
+
+    with pytest.raises(ValueError):
+        counter.inc()
+
+    with pytest.raises(ValueError):
+        counter.inc(method='get', status='200')
+
+
+def test_time():
+    histogram = Histogram('test_seconds', 'Test.', ('name',))
+
+    with histogram.time(name='block'):
+        pass
+
+    @histogram.time(name='function')
+    def function():
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        function()
+
+    assert histogram.count(name='block') == 1
+    assert histogram.count(name='function') == 1
+
+
+def test_write(registry, tmpdir):
+    path = str(tmpdir.join('relay.prom'))
+
+    # The existing file is replaced (on Windows too).
+    for _ in range(2):
+        registry.write(path)
+
+    with open(path) as metrics_file:
+        assert metrics_file.read() == registry.render()
+
+    assert os.listdir(str(tmpdir)) == ['relay.prom']
+
+
+def test_serve(registry):
+    server = registry.serve(0)
+    try:
+        url = 'http://127.0.0.1:{}/metrics'.format(server.server_port)
+        response = urlopen(url)
+        assert response.read().decode('utf-8') == registry.render()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_invoke_relay_command_metrics_port():
+    runner = CliRunner(mix_stderr=False)
+
+    with runner.isolated_filesystem():
+        with mock.patch('relay.cli.REGISTRY.serve') as serve:
+            server = serve.return_value
+            server.server_address = ('127.0.0.1', 54321)
+
+            result = runner.invoke(relay, [
+                '--metrics_port', '0', 'validate', '--no_cache', '.',
+            ])
+
+    serve.assert_called_once_with(0)
+    assert result.stderr.startswith(
+        'Serving metrics on http://127.0.0.1:54321/metrics\n'
+    )
+
+    # The socket is closed as well, not just the serving thread stopped.
+    server.shutdown.assert_called_once_with()
+    server.server_close.assert_called_once_with()
+
+
+def test_invoke_relay_command_metrics_file(env):
+    settings = {
+        'name': '$NAME',
+        'module_type_id': 'a14ae422-01b6-5013-9876-695ff1b0ebe0',
+        'visibility': 'org',
+        'settings': {
+            'url': '$URL',
+            'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+        },
+    }
+
+    runner = CliRunner()
+
+    with runner.isolated_filesystem():
+        with open(SETTINGS_FILE_DEFAULT, 'w') as settings_file:
+            settings_file.write(json.dumps(settings))
+
+        with mock.patch('relay.api.ThreatResponse') as mock_tr:
+            module_instance = mock_tr.return_value.int.module_instance
+            module_instance.get.return_value = []
+            module_instance.post.side_effect = RuntimeError('Oops!')
+
+            result = runner.invoke(
+                relay, ['--metrics_file', 'relay.prom', 'add']
+            )
+
+        assert result.exit_code == 1
+
+        with open('relay.prom') as metrics_file:
+            metrics = metrics_file.read()
+
+    assert 'relay_auth_duration_seconds_count ' in metrics
+    assert 'relay_settings_load_duration_seconds_count ' in metrics
+    assert (
+        'relay_api_request_duration_seconds_count'
+        '{api="module_instance",method="get"} ' in metrics
+    )
+    # The module type catalog is fetched through the same wrapper too.
+    assert (
+        'relay_api_request_duration_seconds_count'
+        '{api="module_type",method="get"} ' in metrics
+    )
+    assert (
+        'relay_api_request_errors_total'
+        '{api="module_instance",method="post"} ' in metrics
+    )
@@ -0,0 +1,79 @@
+import json
+import os
+import pstats
+import time
+
+from click.testing import CliRunner
+
+from relay.cli import relay
+from relay.constants import RELAY_MODULE_SUPPORTED_APIS
+from relay.profiling import Profiler
+
+
+def sleepy():
+    time.sleep(0.1)
+
+
+def test_profiler(tmpdir):
+    profiler = Profiler(interval=0.001)
+
+    profiler.start()
+    sleepy()
+    profiler.stop()
+
+    assert any(
+        stack.split(';')[-1].startswith('sleepy (test_profiling.py:')
+        for stack in profiler.stacks
+    )
+
+    pstats_path, collapsed_path = profiler.write(str(tmpdir.join('relay')))
+
+    stats = pstats.Stats(pstats_path)
+    cumulative, = [
+        stats.stats[key][3] for key in stats.stats if key[2] == 'sleepy'
+    ]
+    # Sleeping takes (nearly) no CPU time, unlike the wall-clock time.
+    assert cumulative < 0.05
+
+    # The sampler itself never shows up in the stats.
+    assert not any(
+        name in ('_sample', '_collapse') for _, _, name in stats.stats
+    )
+
+    with open(collapsed_path) as stacks_file:
+        for line in stacks_file:
+            stack, count = line.rsplit(' ', 1)
+            assert stack and int(count) > 0
+
+
+def test_invoke_relay_command_profile(env):
+    settings = {
+        'name': '$NAME',
+        'module_type_id': 'a14ae422-01b6-5013-9876-695ff1b0ebe0',
+        'visibility': 'org',
+        'settings': {
+            'url': '$URL',
+            'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+        },
+    }
+
+    runner = CliRunner(mix_stderr=False)
+
+    with runner.isolated_filesystem():
+        with open('relay_settings.json', 'w') as settings_file:
+            settings_file.write(json.dumps(settings))
+
+        result = runner.invoke(relay, [
+            '--profile', 'relay', '--profile_top', '5',
+            'validate', '--jobs', '1', '--no_cache', 'relay_settings.json',
+        ])
+
+        assert result.exit_code == 0
+        assert sorted(os.listdir('.')) == [
+            'relay.collapsed', 'relay.pstats', 'relay_settings.json',
+        ]
+
+    assert 'Ordered by: cumulative time' in result.stderr
+    assert result.stderr.endswith(
+        'Profile written to: relay.pstats, relay.collapsed\n'
+    )
@@ -79,3 +79,59 @@ def test_load_settings_expansion_error(env, settings_file):
 
     with pytest.raises(SettingsValidationError):
         load_settings(settings_file)
+
+
+def test_load_settings_catalog_error(env, settings_file):
+    data = settings_data()
+
+    write_to(settings_file, json.dumps(data))
+
+    with pytest.raises(SettingsValidationError, match='Unknown'):
+        load_settings(settings_file, catalog={'<another id>': {}})
+
+    catalog = {
+        data['module_type_id']: {
+            'title': 'Relay',
+            'settings': {'url': True, 'supported-apis': True, 'token': True},
+        },
+    }
+
+    settings_file.seek(0)
+
+    with pytest.raises(SettingsValidationError, match='Missing keys: token'):
+        load_settings(settings_file, catalog)
+
+
+def test_load_settings_catalog_ok(env, settings_file, caplog):
+    data = settings_data()
+    data['settings']['token'] = '<token>'
+
+    write_to(settings_file, json.dumps(data))
+
+    # The keys defined by the schema are known even if the catalog omits them.
+    catalog = {
+        data['module_type_id']: {
+            'title': 'Relay',
+            'settings': {'auth': False},
+        },
+    }
+
+    settings = load_settings(settings_file, catalog)
+
+    assert settings['name'] == env['NAME']
+    assert [record.getMessage() for record in caplog.records] == [
+        'Relay settings for module type "Relay" have keys unknown to '
+        'the module type catalog: token.'
+    ]
+
+    # An empty catalog is no catalog at all.
+    settings_file.seek(0)
+
+    assert load_settings(settings_file, {}) == settings
+
+    # The keys of the settings are not checked if the spec is unknown.
+    catalog[data['module_type_id']]['settings'] = {}
+
+    settings_file.seek(0)
+
+    assert load_settings(settings_file, catalog) == settings
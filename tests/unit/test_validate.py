@@ -0,0 +1,144 @@
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from relay.cli import relay
+from relay.constants import (
+    RELAY_MODULE_SUPPORTED_APIS,
+    VALIDATE_CACHE_FILE_DEFAULT,
+)
+from relay.validate import ValidationCache, validate_files
+
+
+def settings_data():
+    return {
+        'name': '${NAME}',
+        'module_type_id': 'a14ae422-01b6-5013-9876-695ff1b0ebe0',
+        'visibility': 'org',
+        'settings': {
+            'url': '$URL',
+            'supported-apis': list(RELAY_MODULE_SUPPORTED_APIS),
+        },
+    }
+
+
+@pytest.fixture(scope='function')
+def runner():
+    runner = CliRunner(mix_stderr=False)
+
+    with runner.isolated_filesystem():
+        os.mkdir('settings')
+
+        for index in range(8):
+            path = os.path.join('settings', '{}.json'.format(index))
+            with open(path, 'w') as settings_file:
+                settings_file.write(json.dumps(settings_data()))
+
+        yield runner
+
+
+def write_to(path, text):
+    with open(path, 'w') as settings_file:
+        settings_file.write(text)
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_validate_files(env, runner, jobs):
+    write_to(os.path.join('settings', '3.json'), 'Hello, World!')
+
+    paths = sorted(os.path.join('settings', name)
+                   for name in os.listdir('settings'))
+
+    reports = sorted(validate_files(paths, jobs))
+
+    assert [report.file for report in reports] == paths
+    assert [bool(report.error) for report in reports] == [
+        False, False, False, True, False, False, False, False,
+    ]
+    assert not any(report.cached for report in reports)
+
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_validate_files_unexpected_errors(env, runner, jobs):
+    settings = settings_data()
+    settings['name'] = 'cost 5$ only'
+    write_to(os.path.join('settings', '1.json'), json.dumps(settings))
+
+    with open(os.path.join('settings', '2.json'), 'wb') as settings_file:
+        settings_file.write(b'{"name": "\xff"}')
+
+    paths = sorted(os.path.join('settings', name)
+                   for name in os.listdir('settings'))
+
+    reports = sorted(validate_files(paths, jobs))
+
+    assert [report.file for report in reports] == paths
+    assert reports[1].error.startswith(
+        'Unable to expand Relay settings JSON: Invalid placeholder'
+    )
+    assert reports[2].error.startswith('Unable to read Relay settings file:')
+    assert [bool(report.error) for report in reports] == [
+        False, True, True, False, False, False, False, False,
+    ]
+
+
+def test_validate_files_cache(env, runner):
+    paths = [os.path.join('settings', '0.json')]
+
+    cache = ValidationCache(VALIDATE_CACHE_FILE_DEFAULT)
+    assert not list(validate_files(paths, cache=cache))[0].cached
+    cache.save()
+
+    cache = ValidationCache(VALIDATE_CACHE_FILE_DEFAULT)
+    assert list(validate_files(paths, cache=cache))[0].cached
+
+    # The values of the referred environment variables matter too.
+    env['URL'] = '<another URL>'
+    assert not list(validate_files(paths, cache=cache))[0].cached
+
+    # Errors are never cached.
+    del env['NAME']
+    for _ in range(2):
+        report, = validate_files(paths, cache=cache)
+        assert report.error and not report.cached
+
+
+def test_invoke_validate_ok(env, runner):
+    result = runner.invoke(relay, ['validate', 'settings'])
+
+    assert result.exit_code == 0
+    assert result.stdout == ''
+    assert result.stderr == (
+        'All 8 Relay settings files are valid '
+        '(0 unchanged since the last validation)!\n'
+    )
+
+    result = runner.invoke(relay, ['validate', '--jobs', '2', 'settings'])
+
+    assert result.exit_code == 0
+    assert '(8 unchanged since the last validation)' in result.stderr
+
+    result = runner.invoke(relay, ['validate', '--no_cache', 'settings'])
+
+    assert result.exit_code == 0
+    assert '(0 unchanged since the last validation)' in result.stderr
+
+
+def test_invoke_validate_error(env, runner):
+    del env['NAME']
+
+    path = os.path.join('settings', '0.json')
+
+    result = runner.invoke(relay, ['validate', path])
+
+    assert result.exit_code == 1
+    assert json.loads(result.stdout) == {
+        'file': path,
+        'error': ('Unable to read environment variable "NAME" for Relay '
+                  'settings JSON expansion. Make sure to define it first.'),
+    }
+    assert result.stderr == (
+        'Error: 1 of 1 Relay settings files are invalid!\n'
+    )